@@ -34,7 +34,24 @@ DATA_FOLDER_PATH = f'{BASE_PATH}/data'
 
 CONECTION_TIMEOUT = 10
 
+EXTRACTION_DEFAULT_WORKERS = 4
+DOWNLOAD_MAX_RETRIES = 3
+DOWNLOAD_BACKOFF_FACTOR = 1  # seconds, doubled on every retry
+DOWNLOAD_REQUESTS_PER_SECOND_PER_HOST = 4
+DOWNLOAD_CHUNK_SIZE_MB = 4
+
 
 EXTRACTION_DEFAULT_END_YEAR = datetime.now().year - 5
 
 VALID_FILE_OUTPUT_FORMATS = ['csv', 'parquet']
+
+# Rows per row group of the partitions of the merged dataset. Around a month of minute bars, so time range filters can
+# skip most of a year without making the column statistics too coarse.
+DATASET_ROW_GROUP_SIZE = 32768
+
+# Data quality
+QUALITY_SESSION_GAP_MINUTES = 360  # Longer gaps are market closures (weekends, holidays), not missing bars
+QUALITY_VOLUME_OUTLIER_DEVIATIONS = 20  # Median absolute deviations above the median volume
+
+# Feature store
+FEATURE_STORE_MAX_SIZE_MB = 2048  # Least recently used feature matrices are evicted above this size
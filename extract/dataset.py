@@ -0,0 +1,135 @@
+import os
+from datetime import datetime
+from typing import List, Iterator
+
+import config
+import pandas as pd
+import pyarrow
+import pyarrow.csv
+import pyarrow.dataset
+import pyarrow.parquet
+
+PARTITIONING = pyarrow.dataset.partitioning(
+    pyarrow.schema([('market', pyarrow.string()), ('asset', pyarrow.string()), ('year', pyarrow.int32())]),
+    flavor='hive'
+)
+PARTITION_FILENAME = 'part-0.parquet'
+
+
+def get_dataset_path() -> str:
+    return os.path.join(config.DATA_FOLDER_PATH, 'merged', 'dataset')
+
+
+def get_partition_path(market: str, asset: str, year: str, dataset_path: str = None) -> str:
+    dataset_path = get_dataset_path() if dataset_path is None else dataset_path
+    return os.path.join(dataset_path, f'market={market}', f'asset={asset}', f'year={year}', PARTITION_FILENAME)
+
+
+def write_partition(df: pd.DataFrame, market: str, asset: str, year: str, dataset_path: str = None) -> None:
+    """
+        Writes the bars of one asset-year as a partition of the dataset. Rows are sorted by date so the statistics of
+        each row group let the readers skip the ones outside the requested time range.
+    """
+    partition_path = get_partition_path(market, asset, year, dataset_path)
+    os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+    df = df.drop(columns=[column for column in ('market', 'asset', 'year') if column in df.columns]).sort_values(by='date', kind='stable')
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+
+    # The dataset readers skip files starting with a dot, so a partition being written, or left by a crash, isn't read
+    temporal_path = os.path.join(os.path.dirname(partition_path), f'.{PARTITION_FILENAME}.{os.getpid()}.tmp')
+    pyarrow.parquet.write_table(table, temporal_path, row_group_size=config.DATASET_ROW_GROUP_SIZE, write_statistics=True)
+    os.replace(temporal_path, partition_path)
+
+
+def list_partition_files(dataset_path: str = None) -> Iterator[str]:
+    dataset_path = get_dataset_path() if dataset_path is None else dataset_path
+    for folder_path, folder_names, filenames in os.walk(dataset_path):
+        folder_names.sort()  # market, asset and year order, so the exports are deterministic
+        for filename in filenames:
+            if filename == PARTITION_FILENAME:
+                yield os.path.join(folder_path, filename)
+
+
+def iter_batches(dataset_path: str = None) -> Iterator[pyarrow.RecordBatch]:
+    """
+        Yields the whole dataset one row group at a time, with the market and asset partition columns added, so it can be
+        processed keeping in memory a single batch instead of the full history of every asset.
+    """
+    dataset_path = get_dataset_path() if dataset_path is None else dataset_path
+    for partition_file in list_partition_files(dataset_path):
+        partition_keys = dict(folder.split('=', 1) for folder in os.path.relpath(os.path.dirname(partition_file), dataset_path).split(os.sep))
+        parquet_file = pyarrow.parquet.ParquetFile(partition_file)
+        for batch in parquet_file.iter_batches(batch_size=config.DATASET_ROW_GROUP_SIZE):
+            # RecordBatch.append_column doesn't exist in the pinned pyarrow version
+            yield pyarrow.RecordBatch.from_arrays(
+                batch.columns + [pyarrow.repeat(partition_keys['asset'], batch.num_rows), pyarrow.repeat(partition_keys['market'], batch.num_rows)],
+                names=batch.schema.names + ['asset', 'market']
+            )
+
+
+def export_dataset(output_path: str, output_format: str, dataset_path: str = None) -> int:
+    """ Streams the dataset into a single csv or parquet file. Returns the number of exported rows """
+    writer = None
+    rows = 0
+    temporal_path = f'{output_path}.tmp'
+    try:
+        for batch in iter_batches(dataset_path):
+            if writer is None:
+                if output_format == 'csv':
+                    writer = pyarrow.csv.CSVWriter(temporal_path, batch.schema)
+                else:
+                    writer = pyarrow.parquet.ParquetWriter(temporal_path, batch.schema)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is not None:
+        os.replace(temporal_path, output_path)
+    return rows
+
+
+def _to_utc_timestamp(value) -> pd.Timestamp:
+    """ Dates of the dataset are UTC, naive values are considered to be UTC too """
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+
+def open_dataset(dataset_path: str = None) -> pyarrow.dataset.Dataset:
+    dataset_path = get_dataset_path() if dataset_path is None else dataset_path
+    return pyarrow.dataset.dataset(dataset_path, format='parquet', partitioning=PARTITIONING)
+
+
+def load_bars(assets: List[str] = None, start: datetime = None, end: datetime = None, columns: List[str] = None,
+              market: str = None, dataset_path: str = None) -> pd.DataFrame:
+    """
+        Loads the bars of the given assets between start (included) and end (excluded). Only the partitions of the
+        requested market, assets and years are opened, and inside them only the row groups whose date statistics overlap
+        the time range are read. If columns is specified only those columns are loaded (plus date and asset).
+    """
+    dataset = open_dataset(dataset_path)
+
+    filters = []
+    if market is not None:
+        filters.append(pyarrow.dataset.field('market') == market)
+    if assets is not None:
+        filters.append(pyarrow.dataset.field('asset').isin(assets))
+    if start is not None:
+        start = _to_utc_timestamp(start)
+        filters.append(pyarrow.dataset.field('year') >= start.year)
+        filters.append(pyarrow.dataset.field('date') >= pyarrow.scalar(start, dataset.schema.field('date').type))
+    if end is not None:
+        end = _to_utc_timestamp(end)
+        filters.append(pyarrow.dataset.field('year') <= end.year)
+        filters.append(pyarrow.dataset.field('date') < pyarrow.scalar(end, dataset.schema.field('date').type))
+
+    expression = None
+    for dataset_filter in filters:
+        expression = dataset_filter if expression is None else expression & dataset_filter
+
+    if columns is not None:
+        columns = ['date', 'asset'] + [column for column in columns if column not in ('date', 'asset')]
+
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    return df.sort_values(by=['asset', 'date'], kind='stable').reset_index(drop=True)
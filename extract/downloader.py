@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import NamedTuple, Callable
+from urllib.parse import urlparse
+
+import config
+import requests
+from requests.adapters import HTTPAdapter
+
+from exceptions import ResourceNotFoundException, DownloadFailedException, ChecksumMismatchException
+
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+MD5_ETAG_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class RemoteInfo(NamedTuple):
+    size: int
+    etag: str
+
+
+class DownloadResult(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+    etag: str
+
+
+class HostRateLimiter:
+    """ Spaces out the requests sent to the same host so that concurrent workers don't flood the source. """
+
+    def __init__(self, requests_per_second: float):
+        self._min_interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = dict()
+
+    def wait(self, url: str) -> None:
+        if self._min_interval == 0:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self._min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Downloader:
+    """ Shared, connection-pooled HTTP client used by the extractors. It is safe to use it from several threads. """
+
+    def __init__(self, workers: int = config.EXTRACTION_DEFAULT_WORKERS, max_retries: int = config.DOWNLOAD_MAX_RETRIES,
+                 backoff_factor: float = config.DOWNLOAD_BACKOFF_FACTOR,
+                 requests_per_second: float = config.DOWNLOAD_REQUESTS_PER_SECOND_PER_HOST):
+        self._logger = logging.getLogger("extract_logger")
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._rate_limiter = HostRateLimiter(requests_per_second)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def download(self, url: str, file_path: str, chunk_size_mb: float = config.DOWNLOAD_CHUNK_SIZE_MB) -> DownloadResult:
+        """
+            Downloads url into file_path through a .part file. If the .part file already exists (the previous run was
+            interrupted) the download is resumed with a Range request. The file is only moved to file_path once its size
+            and checksum have been verified. 404 is raised straight away, any other error is retried with backoff.
+        """
+        part_path = f'{file_path}.part'
+        chunk_size = int(chunk_size_mb * 1024 * 1024)
+        return self._with_retries(url, self._download_part, url, file_path, part_path, chunk_size)
+
+    def get_remote_info(self, url: str) -> RemoteInfo:
+        """ Asks the source for the size and ETag of url without downloading it """
+        return self._with_retries(url, self._head, url)
+
+    def _with_retries(self, url: str, function: Callable, *args):
+        attempt = 0
+        while True:
+            try:
+                return function(*args)
+            except (requests.RequestException, ChecksumMismatchException) as e:
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise DownloadFailedException(f"Download of {url} failed after {attempt} attempts: {e}") from e
+                backoff = self._backoff_factor * 2 ** (attempt - 1)
+                self._logger.warning(f"Download of {url} failed ({e}). Retrying in {backoff}s ({attempt}/{self._max_retries})...")
+                time.sleep(backoff)
+
+    def _head(self, url: str) -> RemoteInfo:
+        self._rate_limiter.wait(url)
+        response = self._session.head(url, allow_redirects=True, timeout=config.CONECTION_TIMEOUT)
+        if response.status_code == 404:
+            raise ResourceNotFoundException("The next resource doesn't exist. Please check if the URL is malformed or "
+                                            f"if the resource is inexistent.\n\t{url}")
+        response.raise_for_status()
+        content_length = response.headers.get('Content-Length')
+        return RemoteInfo(int(content_length) if content_length is not None else None, response.headers.get('ETag'))
+
+    def _download_part(self, url: str, file_path: str, part_path: str, chunk_size: int) -> DownloadResult:
+        part_info = Downloader._read_part_info(part_path)
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        headers = dict()
+        if offset > 0:
+            headers['Range'] = f'bytes={offset}-'
+            if part_info.get('etag'):
+                headers['If-Range'] = part_info['etag']
+
+        self._rate_limiter.wait(url)
+        restart = False
+        with self._session.get(url, headers=headers, stream=True, timeout=config.CONECTION_TIMEOUT) as response:
+            if response.status_code == 404:
+                raise ResourceNotFoundException("The next resource doesn't exist. Please check if the URL is malformed or "
+                                                f"if the resource is inexistent.\n\t{url}")
+            if response.status_code == 416 and offset > 0 and offset == part_info.get('size'):
+                etag = part_info.get('etag')  # The .part file was already complete when the previous run stopped
+            elif response.status_code == 416:
+                # The .part file doesn't belong to the remote file (its .part.json was lost or is out of date, or it is
+                # bigger than the remote file), resuming it would fail forever
+                restart = True
+            else:
+                response.raise_for_status()
+                etag = response.headers.get('ETag')
+                if response.status_code == 206:
+                    total_size = int(response.headers['Content-Range'].split('/')[-1])
+                    mode = 'ab'
+                else:
+                    # The server ignored the Range header or the remote file changed, start from scratch
+                    content_length = response.headers.get('Content-Length')
+                    total_size = int(content_length) if content_length is not None else None
+                    mode = 'wb'
+                Downloader._write_part_info(part_path, {'etag': etag, 'size': total_size})
+
+                # Keep whatever arrived before a dropped connection, the size check below triggers the resume
+                response.raw.enforce_content_length = False
+                with open(part_path, mode) as part_file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        part_file.write(chunk)
+
+        if restart:
+            self._logger.warning(f"Partial download of {url} doesn't match the remote file, starting from scratch")
+            Downloader._discard_part(part_path)
+            return self._download_part(url, file_path, part_path, chunk_size)
+        return Downloader._verify_and_commit(url, file_path, part_path, etag)
+
+    @staticmethod
+    def _verify_and_commit(url: str, file_path: str, part_path: str, etag: str) -> DownloadResult:
+        expected_size = Downloader._read_part_info(part_path).get('size')
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size < expected_size:
+            raise requests.exceptions.ChunkedEncodingError(f"Connection dropped after {size}/{expected_size} bytes")
+
+        sha256, md5 = Downloader._compute_hashes(part_path)
+
+        etag_value = etag.strip('"') if etag is not None and not etag.startswith('W/') else None
+        if (expected_size is not None and size != expected_size) or \
+                (etag_value is not None and MD5_ETAG_PATTERN.fullmatch(etag_value) and etag_value != md5.hexdigest()):
+            Downloader._discard_part(part_path)
+            raise ChecksumMismatchException(f"Downloaded file for {url} doesn't match the size or the checksum announced by the source")
+
+        os.replace(part_path, file_path)
+        Downloader._discard_part(part_path)
+        return DownloadResult(file_path, size, sha256.hexdigest(), etag)
+
+    @staticmethod
+    def compute_sha256(file_path: str) -> str:
+        return Downloader._compute_hashes(file_path)[0].hexdigest()
+
+    @staticmethod
+    def _compute_hashes(file_path: str) -> tuple:
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        with open(file_path, 'rb') as hashed_file:
+            for block in iter(lambda: hashed_file.read(HASH_BLOCK_SIZE), b''):
+                sha256.update(block)
+                md5.update(block)
+        return sha256, md5
+
+    @staticmethod
+    def _read_part_info(part_path: str) -> dict:
+        try:
+            with open(f'{part_path}.json', 'r') as info_file:
+                return json.load(info_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return dict()
+
+    @staticmethod
+    def _write_part_info(part_path: str, part_info: dict) -> None:
+        with open(f'{part_path}.json', 'w') as info_file:
+            json.dump(part_info, info_file)
+
+    @staticmethod
+    def _discard_part(part_path: str) -> None:
+        for path in (part_path, f'{part_path}.json'):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def close(self) -> None:
+        self._session.close()
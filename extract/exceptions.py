@@ -35,7 +35,31 @@ class InvalidOutputFileTypeException(Exception):
     """
 
 
-class ColumnNamesMisinterpreted(Exception):
+class DownloadFailedException(Exception):
     """
-        Specified columns do not match with its values
+        Download kept failing after all the retries. The source could be down or rate limiting the extraction.
+    """
+
+
+class InvalidWorkersValueException(Exception):
+    """
+        Specified number of workers is not valid
+    """
+
+
+class ChecksumMismatchException(Exception):
+    """
+        Downloaded file doesn't match the size or the checksum announced by the source
+    """
+
+
+class InvalidChunkSizeValueException(Exception):
+    """
+        Specified download chunk size is not valid
+    """
+
+
+class InvalidFillPolicyException(Exception):
+    """
+        Specified fill policy of the panel is not valid
     """
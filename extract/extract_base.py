@@ -31,8 +31,7 @@ class ExtractBase(ABC):
         self._check_asset_validity()
 
     def _create_basic_folder_structure(self) -> None:
-        os.makedirs(os.path.join(config.DATA_FOLDER_PATH, self._market, "merged"), exist_ok=True)
-        os.makedirs(os.path.join(config.DATA_FOLDER_PATH, "merged"), exist_ok=True)
+        os.makedirs(os.path.join(config.DATA_FOLDER_PATH, "merged", "dataset"), exist_ok=True)
 
     def _check_asset_validity(self) -> None:
         invalid_assets = []
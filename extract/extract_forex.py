@@ -1,146 +1,229 @@
 import os
 import sys
 import pyarrow
+import pyarrow.csv
+import pyarrow.compute
+import pyarrow.parquet
 
-from typing import List
+from typing import List, Iterator, Tuple
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 sys.path.append(os.getcwd())
-import shutil
 import config
-import requests
 import zipfile
 import pandas as pd
 
+import dataset
+import quality
+from timestamps import parse_axiory_timestamp_array, parse_axiory_timestamps, TIMESTAMP_TYPE
+from memory import get_memory_high_water_mark
+from manifest import ExtractionManifest
+from downloader import Downloader, DownloadResult
 from extract_base import ExtractBase
-from exceptions import ResourceNotFoundException, ColumnNamesMisinterpreted
+from exceptions import ResourceNotFoundException, DownloadFailedException, ChecksumMismatchException
+
+RAW_COLUMN_TYPES = {
+    'date': pyarrow.string(),
+    'hour': pyarrow.string(),
+    'col1': pyarrow.float64(),
+    'col2': pyarrow.float64(),
+    'col3': pyarrow.float64(),
+    'col4': pyarrow.float64(),
+    'vol': pyarrow.int64()
+}
+RAW_COLUMN_NAMES = list(RAW_COLUMN_TYPES.keys())
+YEAR_FILE_SCHEMA = pyarrow.schema([('date', TIMESTAMP_TYPE)] + [(name, dtype) for name, dtype in RAW_COLUMN_TYPES.items() if name not in ('date', 'hour')])
 
 
 class ExtractForex(ExtractBase):
 
-    def __init__(self, market: str = 'forex', assets: List[str] = ['USDEUR'], start_year: int = 2017, end_year: int = 2023):
+    def __init__(self, market: str = 'forex', assets: List[str] = ['USDEUR'], start_year: int = 2017, end_year: int = 2023,
+                 workers: int = config.EXTRACTION_DEFAULT_WORKERS, chunk_size_mb: float = config.DOWNLOAD_CHUNK_SIZE_MB):
         super().__init__(market, assets, start_year, end_year)
+        self._workers = workers
+        self._chunk_size_mb = chunk_size_mb
+        self._manifest = ExtractionManifest(market)
 
     def _extract_data(self):
-        index = 0
-        for currency_pair in self._assets:
-            index += 1
-            self._logger.info(f"Extracting {index}/{len(self._assets)} -  {currency_pair}...")
-            for year in range(self._start_year, self._end_year + 1):
-                try:
-                    self._download_and_unzip_files(str(year), currency_pair)
-                except ResourceNotFoundException as e:
-                    self._logger.exception(f"[404 ERROR]: URL for year {year} and currency pair: {currency_pair} haven't been found. Continuing extraction...")
-
-    @staticmethod
-    def clean_directories(currency_pair: str, year_folder_path: str, zip_file_path: str) -> None:
-        os.remove(zip_file_path)
-        shutil.rmtree(os.path.join(year_folder_path, '__MACOSX'), ignore_errors=True)
-
-        if currency_pair in os.listdir(year_folder_path):
-            # In 2018 and previous years, zips come with a subfolder of the
-            currency_subfolder_path = os.path.join(year_folder_path, currency_pair)
-            subfolder_files = os.listdir(currency_subfolder_path)
-
-            for subfolder_file in subfolder_files:
-                if os.path.isfile(os.path.join(year_folder_path, subfolder_file)):
-                    os.remove(os.path.join(year_folder_path, subfolder_file))
-                shutil.move(os.path.join(currency_subfolder_path, subfolder_file), year_folder_path)
-            os.rmdir(currency_subfolder_path)
-
-    def _download_and_unzip_files(self, year: str, currency_pair: str) -> None:
-        url = config.SOURCES[self._market].format(year, currency_pair)
-        response = requests.get(url, stream=True, timeout=config.CONECTION_TIMEOUT)
-        response_code = response.status_code
-
+        """ Downloads every (currency pair, year) zip using a bounded pool of workers over a shared session """
+        tasks = [(currency_pair, str(year)) for currency_pair in self._assets for year in range(self._start_year, self._end_year + 1)]
+        self._logger.info(f"Extracting {len(tasks)} files for {len(self._assets)} assets using {self._workers} workers...")
+
+        downloader = Downloader(workers=self._workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                futures = {executor.submit(self._download_and_unzip_files, year, currency_pair, downloader): (currency_pair, year)
+                           for currency_pair, year in tasks}
+                for index, future in enumerate(as_completed(futures), start=1):
+                    currency_pair, year = futures[future]
+                    try:
+                        future.result()
+                        self._logger.info(f"Extracted {index}/{len(tasks)} -  {currency_pair} {year}")
+                    except ResourceNotFoundException:
+                        self._logger.exception(f"[404 ERROR]: URL for year {year} and currency pair: {currency_pair} haven't been found. Continuing extraction...")
+                    except (DownloadFailedException, ChecksumMismatchException):
+                        self._logger.exception(f"[DOWNLOAD ERROR]: Year {year} and currency pair: {currency_pair} couldn't be downloaded. Continuing extraction...")
+        finally:
+            downloader.close()
+            self._manifest.save()
+
+    def _is_year_up_to_date(self, year: str, currency_pair: str, url: str, downloader: Downloader) -> bool:
+        """
+            Closed years never change, so once they have been extracted after the year ended they don't have to be
+            downloaded again. For the current year, or a past one extracted while it was still open, the source is asked
+            for the size and ETag of the file and compared with the manifest.
+        """
+        entry = self._manifest.get(currency_pair, year)
+        if entry is None or not os.path.isfile(ExtractForex.get_year_file_path(self._market, currency_pair, year)):
+            return False
+        if datetime.fromisoformat(entry['extracted_at']) >= datetime(int(year) + 1, 1, 1):
+            return True
+        remote_info = downloader.get_remote_info(url)
+        return self._manifest.is_source_unchanged(currency_pair, year, remote_info.size, remote_info.etag)
+
+    def _download_and_unzip_files(self, year: str, currency_pair: str, downloader: Downloader) -> None:
+        url = self._source_url.format(year, currency_pair)
         year_folder_path = os.path.join(config.DATA_FOLDER_PATH, self._market, currency_pair, year)
-        if response_code == 200:
-            filename = f'{currency_pair}_{year}.zip'
-            zip_file_path = os.path.join(config.DATA_FOLDER_PATH, self._market, currency_pair, year, filename)
-
-            with open(zip_file_path, 'wb') as zip_file:
-                for chunk in response.iter_content(chunk_size=1024):
-                    if chunk:
-                        zip_file.write(chunk)
+        zip_file_path = os.path.join(year_folder_path, f'{currency_pair}_{year}.zip')
+        year_file_path = ExtractForex.get_year_file_path(self._market, currency_pair, year)
 
-            with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                zip_ref.extractall(year_folder_path)
+        if self._is_year_up_to_date(year, currency_pair, url, downloader):
+            self._logger.debug(f"{currency_pair} {year} hasn't changed since the last extraction, skipping download")
+            return
 
-            ExtractForex.clean_directories(currency_pair, year_folder_path, zip_file_path)
-
-        elif response_code == 404:
-            raise ResourceNotFoundException("The next resource doesn't exist. Please check if the URL is malformed or "
-                                            f"if the resource is inexistent.\n\t{url}")
+        if os.path.isfile(zip_file_path):
+            # A zip left in the folder was already verified by a previous run that stopped before ingesting it
+            download_result = DownloadResult(zip_file_path, os.path.getsize(zip_file_path), Downloader.compute_sha256(zip_file_path), None)
         else:
-            raise Exception()
+            download_result = downloader.download(url, zip_file_path, self._chunk_size_mb)
+
+        temporal_file_path = f'{year_file_path}.tmp'
+        rows, start, end = 0, None, None
+        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+            corrupted_member = zip_ref.testzip()
+            if corrupted_member is not None:
+                zip_ref.close()
+                os.remove(zip_file_path)
+                raise ChecksumMismatchException(f"CRC check failed for {corrupted_member} in {url}")
+
+            # Every member is appended to the year file as soon as it is parsed, only one of them is kept in memory
+            with pyarrow.parquet.ParquetWriter(temporal_file_path, YEAR_FILE_SCHEMA) as writer:
+                for member_table in ExtractForex.read_zip_tables(zip_ref):
+                    writer.write_table(member_table)
+                    time_range = pyarrow.compute.min_max(member_table['date'])
+                    rows += member_table.num_rows
+                    start = min(filter(None, [start, time_range['min'].as_py()]), default=None)
+                    end = max(filter(None, [end, time_range['max'].as_py()]), default=None)
+
+        os.replace(temporal_file_path, year_file_path)
+        os.remove(zip_file_path)
+        self._manifest.update(currency_pair, year, download_result.size, download_result.etag, download_result.sha256, rows,
+                              start.isoformat() if start is not None else None, end.isoformat() if end is not None else None)
 
     @staticmethod
-    def get_column_names(df: pd.DataFrame, currency: str, year: str) -> List[str]:
-        """ This method checks if the columns are in the order that they are expected """
-        df.columns = ['date', 'hour', 'col1', 'col2', 'col3', 'col4', 'vol']
-        data_rows = df.shape[0]
-
-        max_column_rows = df.query('col2 >= col1 and col2 >= col3 and col2 >= col4').shape[0]
+    def get_year_file_path(market: str, currency_pair: str, year: str) -> str:
+        return os.path.join(config.DATA_FOLDER_PATH, market, currency_pair, year, f'{currency_pair}_{year}.parquet')
 
-        if data_rows != max_column_rows:
-            raise ColumnNamesMisinterpreted(f"MAX column is not the expected one, please check the dataframe. Happened for currency {currency} and year {year}")
-
-        min_column_rows = df.query('col3 <= col1 and col3 <= col2 and col3 <= col4').shape[0]
-
-        if data_rows != min_column_rows:
-            raise ColumnNamesMisinterpreted(f"MIN column is not the expected one, please check the dataframe. Happened for currency {currency} and year {year} ")
-
-        # TODO: Check how to validate open and close columns. In most of the cases, the col1 price is the col4 price of the previous row, but this does not happen always
-
-        # df['col4_shifted'] = df['col4'].shift(1)
-        # open_close_rows = df.query('col1==col4_shifted').shape[0] + 1  # First record is Nan
-
-        # if data_rows != open_close_rows:
-        #     raise ColumnNamesMisinterpreted(f"OPEN and CLOSE columns are not the expected ones, please check the dataframe. Happened for currency {currency} and year {year}")
+    @staticmethod
+    def read_zip_tables(zip_ref: zipfile.ZipFile) -> Iterator[pyarrow.Table]:
+        """
+            Parses the CSV members of the zip straight into typed Arrow tables, without extracting them to disk.
+            Zips of closed years come with a file with the whole year (*_all.csv) next to the monthly ones, in that case
+            only that file is read. Zips of 2018 and previous years keep the files inside a subfolder and all of them
+            come with a __MACOSX folder that is ignored.
+        """
+        csv_members = sorted(member for member in zip_ref.namelist()
+                             if member.endswith('.csv') and not member.startswith('__MACOSX'))
+        all_members = [member for member in csv_members if member.endswith('all.csv')]
+        if len(all_members) > 0:
+            csv_members = all_members[:1]
+
+        read_options = pyarrow.csv.ReadOptions(column_names=RAW_COLUMN_NAMES, use_threads=True)
+        convert_options = pyarrow.csv.ConvertOptions(column_types=RAW_COLUMN_TYPES)
+        for member in csv_members:
+            with zip_ref.open(member) as member_file:
+                csv_table = pyarrow.csv.read_csv(member_file, read_options=read_options, convert_options=convert_options)
+            # Dates are parsed here once and stored typed, so nothing downstream has to parse strings again
+            yield csv_table.drop(['date', 'hour']).add_column(0, 'date', parse_axiory_timestamp_array(csv_table['date'], csv_table['hour']))
 
-        # df.drop(['col4_shifted'], axis=1, inplace=True)
-        return ['date', 'hour', 'open', 'high', 'low', 'close', 'volume']
+    @staticmethod
+    def read_year_data(market: str, currency: str, year: str) -> Tuple[pd.DataFrame, dict]:
+        """ Reads and normalizes the bars of one asset-year and runs the data quality checks over them """
+        df_aux = pd.read_parquet(ExtractForex.get_year_file_path(market, currency, year))
+        df_aux.dropna(subset=['col1', 'col2', 'col3', 'col4'], how='all', axis=0, inplace=True)  # equivalent columns to open, close, high, low (order is checked by the quality report)
+        if 'hour' in df_aux.columns:  # Year files written before dates were parsed at ingestion
+            df_aux.insert(0, 'date', pd.to_datetime(parse_axiory_timestamps(df_aux.pop('date'), df_aux.pop('hour')), utc=True))
+
+        report = quality.check_bars(df_aux['date'].to_numpy(dtype='datetime64[ns]').view('int64'),
+                                    df_aux[['col1', 'col2', 'col3', 'col4']].to_numpy(dtype='float64'),
+                                    df_aux['vol'].to_numpy())
+
+        df_aux.columns = ['date', 'open', 'high', 'low', 'close', 'volume']
+        df_aux = df_aux[['date', 'open', 'close', 'high', 'low', 'volume']]  # Column reordering
+        df_aux['asset'] = currency
+        df_aux['market'] = market
+        return df_aux, report
 
     @staticmethod
-    def check_or_create_all_file(year_path: str) -> None:
-        """ Checks if the merged file that comes for closed years is in the extracted file. If it is not there, this method creates it. """
-        file_list = os.listdir(year_path)
-        all_files = [file for file in file_list if 'all.csv' in file]
-        if len(all_files) == 0:
-            year_df = pd.DataFrame()
-            for file in file_list:
-                df = pd.read_csv(os.path.join(year_path, file), header=None)
-                year_df = pd.concat([year_df, df], axis=0, ignore_index=True)
-            filename = file.split('_')[0] + '_' + file.split('_')[1] + '_all.csv'
-            year_df.to_csv(os.path.join(year_path, filename), index=False, header=False)
+    def merge_asset_year(market: str, currency: str, year: str) -> dict:
+        """
+            Parses, checks, normalizes and writes the partition of one asset-year and returns its quality report. If the
+            columns can't be interpreted the partition is not written. It runs inside the merge worker processes.
+        """
+        df, report = ExtractForex.read_year_data(market, currency, year)
+        if len(report['errors']) == 0:
+            dataset.write_partition(df, market, currency, year)
+        return report
 
     def _merge_data(self) -> None:
-        full_df = pd.DataFrame()
+        """
+            Writes into the market=<market>/asset=<asset>/year=<year> partitions of the dataset only the asset-years that
+            changed since the last merge, according to the manifest, or whose partition doesn't exist yet.
+        """
         self._logger.info(f'Merging {self._market} data...')
+        pending_asset_years = set(self._manifest.get_pending_merge(self._assets))
+        asset_years_to_merge = []
         for currency in self._assets:
             currency_path = os.path.join(config.DATA_FOLDER_PATH, self._market, currency)
-            for year in os.listdir(currency_path):
-                year_path = os.path.join(currency_path, year)
-                ExtractForex.check_or_create_all_file(year_path)
-
-                year_files = os.listdir(year_path)
-                complete_file = [os.path.join(year_path, file) for file in year_files if 'all.csv' in file][0]
-
-                df_aux = pd.read_csv(complete_file, header=None)
-                df_aux.dropna(subset=[2, 3, 4, 5], how='all', axis=0, inplace=True)  # equivalent columns to open, close, high, low (order is checked in the next line method call)
-                df_aux.columns = ExtractForex.get_column_names(df_aux, currency, year)
-                df_aux = df_aux[['date', 'hour', 'open', 'close', 'high', 'low', 'volume']]  # Column reordering
-                df_aux['asset'] = currency
-
-                full_df = pd.concat([full_df, df_aux], axis=0, ignore_index=True)
-
-        full_df['date'] = pd.to_datetime(full_df['date'] + ' ' + full_df['hour'])
-        full_df['market'] = self._market
-        full_df.drop(['hour'], axis=1, inplace=True)
-        full_df.to_parquet(os.path.join(config.DATA_FOLDER_PATH, self._market, 'merged', f'{self._market}.parquet'), engine='pyarrow', index=False)
+            for year in sorted(os.listdir(currency_path)):
+                if not os.path.isfile(ExtractForex.get_year_file_path(self._market, currency, year)):
+                    continue  # The source didn't have data for this year
+                if (currency, year) in pending_asset_years or not os.path.isfile(dataset.get_partition_path(self._market, currency, year)):
+                    asset_years_to_merge.append((currency, year))
+
+        if len(asset_years_to_merge) == 0:
+            self._logger.info(f'{self._market} merged data is up to date')
+            return
+
+        self._logger.info(f'Merging {len(asset_years_to_merge)} changed asset-years into the {self._market} partitions using {self._workers} workers...')
+        markets, currencies, years = zip(*[(self._market, currency, year) for currency, year in asset_years_to_merge])
+        if self._workers > 1:
+            # Parsing and normalization are CPU bound, so asset-years are spread over processes instead of threads
+            with ProcessPoolExecutor(max_workers=min(self._workers, len(asset_years_to_merge))) as executor:
+                reports = list(executor.map(ExtractForex.merge_asset_year, markets, currencies, years))
+        else:
+            reports = list(map(ExtractForex.merge_asset_year, markets, currencies, years))
+
+        merged_asset_years = []
+        for (currency, year), report in zip(asset_years_to_merge, reports):
+            if len(report['errors']) > 0:
+                self._logger.error(f"[QUALITY ERROR]: {currency} {year} hasn't been merged: {report['errors']}")
+            else:
+                merged_asset_years.append((currency, year))
+                if len(report['warnings']) > 0:
+                    self._logger.warning(f"[QUALITY WARNING]: {currency} {year}: {report['warnings']}")
+        report_path = quality.save_report(self._market, {f'{currency}/{year}': report for (currency, year), report in zip(asset_years_to_merge, reports)})
+        self._logger.info(f'Merged {sum(report["rows"] for report in reports)} rows. Quality report: {report_path}')
+
+        self._manifest.mark_merged(merged_asset_years)
+        self._manifest.save()
 
     def run(self) -> None:
         self._extract_data()
+        self._logger.info(f'Memory high-water mark after extraction: {get_memory_high_water_mark()}')
         self._merge_data()
+        self._logger.info(f'Memory high-water mark after merge: {get_memory_high_water_mark()}')
 
 
 if __name__ == '__main__':
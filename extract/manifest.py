@@ -0,0 +1,76 @@
+import os
+import json
+import threading
+from typing import List, Tuple
+from datetime import datetime
+
+import config
+
+
+class ExtractionManifest:
+    """
+        Persistent record of what has been extracted for every asset-year of a market: source size and ETag, row count,
+        time range and content hash. It lets the extractors skip asset-years that haven't changed in the source and
+        merge only the ones that did.
+    """
+
+    def __init__(self, market: str):
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(config.DATA_FOLDER_PATH, market, 'manifest.json')
+        try:
+            with open(self._manifest_path, 'r') as manifest_file:
+                self._entries = json.load(manifest_file)
+        except FileNotFoundError:
+            self._entries = dict()
+
+    @staticmethod
+    def _key(asset: str, year: str) -> str:
+        return f'{asset}/{year}'
+
+    def get(self, asset: str, year: str) -> dict:
+        with self._lock:
+            return self._entries.get(ExtractionManifest._key(asset, year))
+
+    def is_source_unchanged(self, asset: str, year: str, source_size: int, etag: str) -> bool:
+        """ Compares what the source announces now with what was recorded when the asset-year was extracted """
+        entry = self.get(asset, year)
+        if entry is None:
+            return False
+        if etag is not None and entry['etag'] is not None:
+            return etag == entry['etag']
+        return source_size is not None and source_size == entry['source_size']
+
+    def update(self, asset: str, year: str, source_size: int, etag: str, content_hash: str, rows: int, start: str, end: str) -> bool:
+        """ Records a new extraction of the asset-year. Returns whether its content changed since the last one """
+        key = ExtractionManifest._key(asset, year)
+        with self._lock:
+            previous_entry = self._entries.get(key)
+            changed = previous_entry is None or previous_entry['content_hash'] != content_hash
+            self._entries[key] = {
+                'source_size': source_size,
+                'etag': etag,
+                'content_hash': content_hash,
+                'rows': rows,
+                'start': start,
+                'end': end,
+                'extracted_at': datetime.now().isoformat(timespec='seconds'),
+                'merged': not changed and previous_entry['merged']
+            }
+            return changed
+
+    def get_pending_merge(self, assets: List[str]) -> List[Tuple[str, str]]:
+        with self._lock:
+            return sorted(tuple(key.split('/')) for key, entry in self._entries.items()
+                          if not entry['merged'] and key.split('/')[0] in assets)
+
+    def mark_merged(self, asset_years: List[Tuple[str, str]]) -> None:
+        with self._lock:
+            for asset, year in asset_years:
+                self._entries[ExtractionManifest._key(asset, year)]['merged'] = True
+
+    def save(self) -> None:
+        with self._lock:
+            temporal_path = f'{self._manifest_path}.tmp'
+            with open(temporal_path, 'w') as manifest_file:
+                json.dump(self._entries, manifest_file, indent=2, sort_keys=True)
+            os.replace(temporal_path, self._manifest_path)
@@ -0,0 +1,27 @@
+import sys
+
+import pyarrow
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+MB = 1024 * 1024
+
+
+def _to_mb(max_rss: int) -> float:
+    # ru_maxrss is reported in bytes on macOS and in KB everywhere else
+    return round(max_rss / MB if sys.platform == 'darwin' else max_rss / 1024, 1)
+
+
+def get_memory_high_water_mark() -> dict:
+    """
+        Peak resident memory of the process, peak resident memory of its largest finished child process (the workers of
+        a ProcessPoolExecutor once it is shut down) and peak memory allocated by Arrow in the process, all in MB
+    """
+    report = {'arrow_peak_mb': round(pyarrow.default_memory_pool().max_memory() / MB, 1)}
+    if resource is not None:
+        report['process_peak_mb'] = _to_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        report['children_peak_mb'] = _to_mb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return report
@@ -0,0 +1,139 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import resample
+from exceptions import InvalidFillPolicyException
+
+PANEL_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+PRICE_FIELDS = ['open', 'high', 'low', 'close']
+FILL_POLICIES = ('none', 'ffill', 'close')
+PANEL_ARRAYS = ('timestamps', 'values', 'valid')
+
+
+class Panel(NamedTuple):
+    timestamps: np.ndarray  # (time,) int64 UTC nanoseconds of the common clock
+    assets: List[str]
+    fields: List[str]
+    values: np.ndarray  # (time, asset, field) float64, NaN where there is no bar and it isn't filled
+    valid: np.ndarray  # (time, asset) True where the asset has a real bar
+
+    def get_field(self, field: str) -> np.ndarray:
+        return self.values[:, :, self.fields.index(field)]
+
+
+def build_panel(df: pd.DataFrame, assets: List[str], fields: List[str] = None, fill: str = 'ffill',
+                max_fill_bars: int = None) -> Panel:
+    """
+        Turns the long table (date, asset and the fields) into a dense time x asset x field panel. The clock is the union
+        of the timestamps of every asset and the bars are scattered into it by their integer positions, without pivots.
+
+        Missing bars are handled by the fill policy: 'none' leaves them as NaN, 'ffill' repeats the last bar of the asset
+        and 'close' adds a flat bar at the last close with zero volume. At most max_fill_bars consecutive bars are filled
+        (all if None), and nothing is filled before the first bar of an asset. valid marks the real bars.
+    """
+    if fill not in FILL_POLICIES:
+        raise InvalidFillPolicyException(f'{fill} is not a valid fill policy. Valid policies: {FILL_POLICIES}')
+    fields = [field for field in PANEL_FIELDS if field in df.columns] if fields is None else list(fields)
+
+    df = df[df['asset'].isin(assets)]
+    timestamps = pd.to_datetime(df['date'], utc=True).to_numpy(dtype='datetime64[ns]').view('int64')
+    clock = np.unique(timestamps)
+    rows = np.searchsorted(clock, timestamps)
+    columns = pd.Categorical(df['asset'], categories=assets).codes
+
+    values = np.full((clock.shape[0], len(assets), len(fields)), np.nan)
+    values[rows, columns] = df[fields].to_numpy(dtype=np.float64)
+    valid = np.zeros((clock.shape[0], len(assets)), dtype=bool)
+    valid[rows, columns] = True
+
+    if fill != 'none':
+        # Row of the last real bar of every asset at each time, -1 before its first bar
+        last_valid_rows = np.maximum.accumulate(np.where(valid, np.arange(clock.shape[0])[:, np.newaxis], -1), axis=0)
+        fillable = ~valid & (last_valid_rows >= 0)
+        if max_fill_bars is not None:
+            fillable &= np.arange(clock.shape[0])[:, np.newaxis] - last_valid_rows <= max_fill_bars
+        fill_rows, fill_columns = np.nonzero(fillable)
+        last_values = values[last_valid_rows[fill_rows, fill_columns], fill_columns]
+
+        if fill == 'close' and 'close' in fields:
+            last_close = last_values[:, fields.index('close')]
+            for field_index, field in enumerate(fields):
+                if field in PRICE_FIELDS:
+                    last_values[:, field_index] = last_close
+                elif field == 'volume':
+                    last_values[:, field_index] = 0
+        values[fill_rows, fill_columns] = last_values
+
+    return Panel(timestamps=clock, assets=list(assets), fields=fields, values=values, valid=valid)
+
+
+def get_panel_cache_path(assets: List[str], timeframe: str, fields: List[str], fill: str, max_fill_bars: int,
+                         start: datetime, end: datetime, dataset_path: str = None) -> str:
+    """ Folder of the cached panel, keyed by the panel parameters and by the version of the partitions of its assets """
+    dataset_path = dataset.get_dataset_path() if dataset_path is None else dataset_path
+    panel_key = hashlib.sha256(json.dumps([assets, timeframe, fields, fill, max_fill_bars, str(start), str(end)]).encode()).hexdigest()[:16]
+    source_hash = hashlib.sha256(''.join(resample.get_source_hash(asset, dataset_path) for asset in assets).encode()).hexdigest()[:16]
+    return os.path.join(os.path.dirname(os.path.abspath(dataset_path)), 'cache', 'panels', panel_key, source_hash)
+
+
+def load_panel(panel_path: str) -> Panel:
+    """ Memory maps the arrays of a saved panel, so loading it takes milliseconds whatever its size """
+    with open(os.path.join(panel_path, 'panel.json'), 'r') as metadata_file:
+        metadata = json.load(metadata_file)
+    arrays = {name: np.load(os.path.join(panel_path, f'{name}.npy'), mmap_mode='r') for name in PANEL_ARRAYS}
+    return Panel(assets=metadata['assets'], fields=metadata['fields'], **arrays)
+
+
+def save_panel(panel: Panel, panel_path: str) -> None:
+    temporal_path = f'{panel_path}.{os.getpid()}.tmp'  # Other processes may be saving the same panel at the same time
+    shutil.rmtree(temporal_path, ignore_errors=True)
+    os.makedirs(temporal_path)
+    for name in PANEL_ARRAYS:
+        np.save(os.path.join(temporal_path, f'{name}.npy'), getattr(panel, name))
+    with open(os.path.join(temporal_path, 'panel.json'), 'w') as metadata_file:
+        json.dump({'assets': panel.assets, 'fields': panel.fields}, metadata_file)
+    try:
+        os.replace(temporal_path, panel_path)
+    except OSError:
+        shutil.rmtree(temporal_path, ignore_errors=True)
+        if not os.path.isdir(panel_path):
+            raise
+        # Another process saved the same panel first, it is identical to this one
+
+
+def get_panel(assets: List[str], timeframe: str = '1m', fields: List[str] = None, fill: str = 'ffill',
+              max_fill_bars: int = None, start: datetime = None, end: datetime = None, dataset_path: str = None) -> Panel:
+    """
+        Returns the aligned panel of the assets in the given timeframe between start (included) and end (excluded). It is
+        read from the disk cache and only built again when the partitions of any of the assets changed.
+    """
+    fields = PANEL_FIELDS if fields is None else list(fields)
+    panel_path = get_panel_cache_path(assets, timeframe, fields, fill, max_fill_bars, start, end, dataset_path)
+    if os.path.isdir(panel_path):
+        return load_panel(panel_path)
+
+    if timeframe == '1m':
+        df = dataset.load_bars(assets, start, end, columns=fields, dataset_path=dataset_path)
+    else:
+        df = pd.concat([resample.get_bars(asset, timeframe, dataset_path).assign(asset=asset) for asset in assets])
+        if start is not None:
+            df = df[df['date'] >= dataset._to_utc_timestamp(start)]
+        if end is not None:
+            df = df[df['date'] < dataset._to_utc_timestamp(end)]
+    panel = build_panel(df, assets, fields, fill, max_fill_bars)
+
+    panel_key_path = os.path.dirname(panel_path)
+    os.makedirs(panel_key_path, exist_ok=True)
+    save_panel(panel, panel_path)
+    for folder in os.listdir(panel_key_path):  # Panels built from previous versions of the partitions
+        if folder != os.path.basename(panel_path) and not folder.endswith('.tmp'):
+            shutil.rmtree(os.path.join(panel_key_path, folder), ignore_errors=True)
+    return load_panel(panel_path)
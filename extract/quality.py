@@ -0,0 +1,80 @@
+import os
+import json
+
+import numpy as np
+
+import config
+
+NANOSECONDS_PER_MINUTE = 60 * 10 ** 9
+EXPECTED_HIGH_COLUMN = 1
+EXPECTED_LOW_COLUMN = 2
+
+
+def check_bars(timestamps: np.ndarray, prices: np.ndarray, volume: np.ndarray) -> dict:
+    """
+        Runs every data quality check over a batch of bars with vectorized NumPy operations and returns the number of
+        failures of each one instead of stopping at the first of them.
+
+        timestamps are int64 nanoseconds, prices is a (rows, 4) array with the raw price columns in the order they come
+        from the source (open, high, low, close is the expected one) and volume is the volume column.
+    """
+    rows = prices.shape[0]
+    report = {'rows': rows, 'errors': [], 'warnings': []}
+    if rows == 0:
+        return report
+
+    report['missing_prices'] = int(np.count_nonzero(np.isnan(prices).any(axis=1)))
+
+    # Column order: high has to be the maximum and low the minimum of the row. A few bad ticks are reported as OHLC
+    # inconsistencies, but if other column is the maximum or the minimum more often the columns are misinterpreted.
+    row_max, row_min = np.nanmax(prices, axis=1), np.nanmin(prices, axis=1)
+    max_column_counts = np.count_nonzero(prices == row_max[:, np.newaxis], axis=0)
+    min_column_counts = np.count_nonzero(prices == row_min[:, np.newaxis], axis=0)
+    report['high_column'] = int(max_column_counts.argmax())
+    report['low_column'] = int(min_column_counts.argmax())
+    if max_column_counts[EXPECTED_HIGH_COLUMN] < max_column_counts.max():
+        report['errors'].append('high_column_misinterpreted')
+    if min_column_counts[EXPECTED_LOW_COLUMN] < min_column_counts.max():
+        report['errors'].append('low_column_misinterpreted')
+
+    open_, high, low, close = prices[:, 0], prices[:, EXPECTED_HIGH_COLUMN], prices[:, EXPECTED_LOW_COLUMN], prices[:, 3]
+    report['ohlc_inconsistent_bars'] = int(np.count_nonzero((high < row_max) | (low > row_min)))
+    report['non_positive_prices'] = int(np.count_nonzero(row_min <= 0))
+    report['open_close_discontinuities'] = int(np.count_nonzero(open_[1:] != close[:-1]))
+
+    timestamp_differences = np.diff(timestamps)
+    report['duplicated_timestamps'] = int(np.count_nonzero(timestamp_differences == 0))
+    report['out_of_order_timestamps'] = int(np.count_nonzero(timestamp_differences < 0))
+    gap_minutes = timestamp_differences[timestamp_differences > NANOSECONDS_PER_MINUTE] // NANOSECONDS_PER_MINUTE
+    intraday_gap_minutes = gap_minutes[gap_minutes <= config.QUALITY_SESSION_GAP_MINUTES]
+    report['session_gaps'] = int(gap_minutes.shape[0] - intraday_gap_minutes.shape[0])
+    report['intraday_gaps'] = int(intraday_gap_minutes.shape[0])
+    report['missing_bars'] = int((intraday_gap_minutes - 1).sum())
+
+    volume_median = np.median(volume)
+    volume_deviation = np.median(np.abs(volume - volume_median))
+    report['negative_volume'] = int(np.count_nonzero(volume < 0))
+    report['zero_volume'] = int(np.count_nonzero(volume == 0))
+    report['volume_outliers'] = int(np.count_nonzero(volume > volume_median + config.QUALITY_VOLUME_OUTLIER_DEVIATIONS * max(volume_deviation, 1)))
+
+    for check in ('missing_prices', 'ohlc_inconsistent_bars', 'non_positive_prices', 'duplicated_timestamps', 'out_of_order_timestamps', 'negative_volume'):
+        if report[check] > 0:
+            report['warnings'].append(check)
+    return report
+
+
+def save_report(market: str, reports: dict) -> str:
+    """ Adds the reports of the checked asset-years (keyed by asset/year) to the quality report of the market """
+    report_path = os.path.join(config.DATA_FOLDER_PATH, market, 'quality_report.json')
+    try:
+        with open(report_path, 'r') as report_file:
+            market_report = json.load(report_file)
+    except FileNotFoundError:
+        market_report = dict()
+    market_report.update(reports)
+
+    temporal_path = f'{report_path}.tmp'
+    with open(temporal_path, 'w') as report_file:
+        json.dump(market_report, report_file, indent=2, sort_keys=True)
+    os.replace(temporal_path, report_path)
+    return report_path
@@ -0,0 +1,90 @@
+import os
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow
+import pyarrow.parquet
+
+import dataset
+
+NANOSECONDS_PER_MINUTE = 60 * 10 ** 9
+TIMEFRAMES = {
+    '1m': NANOSECONDS_PER_MINUTE,
+    '5m': 5 * NANOSECONDS_PER_MINUTE,
+    '15m': 15 * NANOSECONDS_PER_MINUTE,
+    '1H': 60 * NANOSECONDS_PER_MINUTE,
+    '4H': 4 * 60 * NANOSECONDS_PER_MINUTE,
+    '1D': 24 * 60 * NANOSECONDS_PER_MINUTE
+}
+
+
+def resample_bars(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+        Aggregates the bars of a single asset, sorted by date, into OHLCV bars of the given timeframe. Every bar is
+        assigned to an integer time bucket (UTC aligned) and open, high, low, close and volume are computed with grouped
+        reductions over the bucket boundaries: first open, max high, min low, last close and summed volume.
+    """
+    bucket_size = TIMEFRAMES[timeframe]
+    timestamps = df['date'].to_numpy(dtype='datetime64[ns]').view('int64')
+    buckets = timestamps // bucket_size
+    if buckets.shape[0] == 0:
+        return df.iloc[0:0].copy()
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [buckets.shape[0]])) - 1
+
+    resampled_df = pd.DataFrame({
+        'date': pd.to_datetime(buckets[starts] * bucket_size, utc=True),
+        'open': df['open'].to_numpy()[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(), starts),
+        'close': df['close'].to_numpy()[ends]
+    })
+    if 'volume' in df.columns:
+        resampled_df['volume'] = np.add.reduceat(df['volume'].to_numpy(), starts)
+    return resampled_df
+
+
+def get_source_hash(asset: str, dataset_path: str = None) -> str:
+    """ Identifies the version of the partitions of an asset, it changes whenever any of them is written again """
+    dataset_path = dataset.get_dataset_path() if dataset_path is None else dataset_path
+    source_hash = hashlib.sha256()
+    for partition_file in dataset.list_partition_files(dataset_path):
+        if f'{os.sep}asset={asset}{os.sep}' in partition_file:
+            file_stat = os.stat(partition_file)
+            source_hash.update(f'{os.path.relpath(partition_file, dataset_path)}:{file_stat.st_size}:{file_stat.st_mtime_ns};'.encode())
+    return source_hash.hexdigest()[:16]
+
+
+def get_cache_path(asset: str, timeframe: str, source_hash: str, dataset_path: str = None) -> str:
+    dataset_path = dataset.get_dataset_path() if dataset_path is None else dataset_path
+    cache_folder_path = os.path.join(os.path.dirname(os.path.abspath(dataset_path)), 'cache', 'bars')
+    return os.path.join(cache_folder_path, f'asset={asset}', f'timeframe={timeframe}', f'{source_hash}.parquet')
+
+
+def get_bars(asset: str, timeframe: str, dataset_path: str = None) -> pd.DataFrame:
+    """
+        Returns the bars of the asset in the given timeframe. They are read from the cache, keyed by (asset, timeframe,
+        source hash), and only computed from the minute bars of the dataset when the partitions of the asset changed.
+    """
+    source_hash = get_source_hash(asset, dataset_path)
+    cache_path = get_cache_path(asset, timeframe, source_hash, dataset_path)
+    if os.path.isfile(cache_path):
+        return pd.read_parquet(cache_path)
+
+    minute_bars = dataset.load_bars([asset], columns=['open', 'high', 'low', 'close', 'volume'], dataset_path=dataset_path)
+    bars = resample_bars(minute_bars, timeframe)
+
+    cache_folder_path = os.path.dirname(cache_path)
+    os.makedirs(cache_folder_path, exist_ok=True)
+    temporal_path = f'{cache_path}.{os.getpid()}.tmp'  # Other processes may be writing the same bars at the same time
+    pyarrow.parquet.write_table(pyarrow.Table.from_pandas(bars, preserve_index=False), temporal_path)
+    os.replace(temporal_path, cache_path)
+    for cache_file in os.listdir(cache_folder_path):  # Bars computed from previous versions of the partitions
+        if cache_file.endswith('.parquet') and cache_file != os.path.basename(cache_path):
+            try:
+                os.remove(os.path.join(cache_folder_path, cache_file))
+            except FileNotFoundError:
+                pass  # Removed by another process
+    return bars
@@ -3,27 +3,29 @@ import sys
 import logging
 from typing import List
 
-import pandas as pd
-
 logging.basicConfig(level=logging.INFO)
 
 import argparse
-from exceptions import StartYearGreaterThanEndYearException, AssetNotValidException, InvalidOutputFileTypeException
+from exceptions import StartYearGreaterThanEndYearException, AssetNotValidException, InvalidOutputFileTypeException, InvalidWorkersValueException, \
+    InvalidChunkSizeValueException
 from extract_forex import ExtractForex
 from datetime import datetime
 sys.path.append(os.getcwd())
 
 import config
+import dataset
+from memory import get_memory_high_water_mark
 from extract.extract_forex import ExtractForex
 
 
 class ExtractionHandler:
 
-    def __init__(self, extraction_asset_list: List[str], start_year: int, end_year: int, output_format: str):
+    def __init__(self, extraction_asset_list: List[str], start_year: int, end_year: int, output_format: str, workers: int = None,
+                 chunk_size_mb: float = None):
         self._logger = logging.getLogger("EXTRACTION_HANDLER")
         self._logger.setLevel(logging.INFO)
         self._split_assets(extraction_asset_list)
-        self._validate_or_populate_arguments(start_year, end_year, output_format)
+        self._validate_or_populate_arguments(start_year, end_year, output_format, workers, chunk_size_mb)
 
     def _split_assets(self, extraction_asset_list: List[str]) -> None:
         valid_assets = []
@@ -42,7 +44,7 @@ class ExtractionHandler:
         if len(invalid_assets) > 0:
             raise AssetNotValidException(f"{invalid_assets} are not included in config file. Please, delete or correct them.")
 
-    def _validate_or_populate_arguments(self, start_year: int, end_year: int, output_format: str) -> None:
+    def _validate_or_populate_arguments(self, start_year: int, end_year: int, output_format: str, workers: int, chunk_size_mb: float) -> None:
         if start_year is None:
             self._start_year = config.EXTRACTION_DEFAULT_END_YEAR
             self._logger.info(f"Start year not specified, defaulting to year: {self._start_year}")
@@ -69,28 +71,52 @@ class ExtractionHandler:
         elif output_format.lower() not in config.VALID_FILE_OUTPUT_FORMATS:
             raise InvalidOutputFileTypeException(f"Specified output file format {output_format} is not valid. Please, insert one of these values {config.VALID_FILE_OUTPUT_FORMATS}")
         else:
-            self._output_format = output_format
+            self._output_format = output_format.lower()
+
+        if workers is None:
+            self._workers = config.EXTRACTION_DEFAULT_WORKERS
+            self._logger.info(f"Workers not specified, defaulting to {self._workers}")
+        elif workers < 1:
+            raise InvalidWorkersValueException(f"Specified number of workers {workers} is not valid. Please, insert a value greater than 0")
+        else:
+            self._workers = workers
+
+        if chunk_size_mb is None:
+            self._chunk_size_mb = config.DOWNLOAD_CHUNK_SIZE_MB
+        elif chunk_size_mb <= 0:
+            raise InvalidChunkSizeValueException(f"Specified chunk size {chunk_size_mb} MB is not valid. Please, insert a value greater than 0")
+        else:
+            self._chunk_size_mb = chunk_size_mb
+
+    def _is_complete_data_up_to_date(self, final_filepath: str) -> bool:
+        """ complete_data only has to be exported again when any partition of the dataset has been written after it """
+        if not os.path.isfile(final_filepath):
+            return False
+        final_file_mtime = os.path.getmtime(final_filepath)
+        return all(os.path.getmtime(partition_file) <= final_file_mtime for partition_file in dataset.list_partition_files())
 
     def _merge_data(self) -> None:
-        self._logger.info('Merging all data...')
-        final_df = pd.DataFrame()
-        for market in config.VALID_ASSETS.keys():
-            filepath = os.path.join(config.DATA_FOLDER_PATH, market, 'merged')
-            try:
-                market_files = os.listdir(filepath)
-                if len(market_files) == 1:
-                    aux_df = pd.read_parquet(os.path.join(filepath, f'{market}.parquet'))
-                final_df = pd.concat([final_df, aux_df], axis=0, ignore_index=True)
-            except FileNotFoundError:
-                """ Crypto and commodities are not implemented so it will fail to create the folders """
+        """
+            Every market writes its partitions into the same dataset, so for parquet output the dataset already is the
+            complete data. For csv output the dataset is exported into a single complete_data.csv file.
+        """
+        if self._output_format == "parquet":
+            self._logger.info(f'All data is available in the partitioned dataset: {dataset.get_dataset_path()}')
+            return
+
         final_filename = 'complete_data'
-        if self._output_format == "csv":
-            final_df.to_csv(os.path.join(config.DATA_FOLDER_PATH, 'merged', f'{final_filename}.csv'), index=False, encoding='utf-8')
-        elif self._output_format == "parquet":
-            final_df.to_parquet(os.path.join(config.DATA_FOLDER_PATH, 'merged', f'{final_filename}.parquet'), index=False)
+        final_filepath = os.path.join(config.DATA_FOLDER_PATH, 'merged', f'{final_filename}.{self._output_format}')
+        if self._is_complete_data_up_to_date(final_filepath):
+            self._logger.info('All data is up to date')
+            return
+
+        self._logger.info('Merging all data...')
+        rows = dataset.export_dataset(final_filepath, self._output_format)
+        self._logger.info(f'Exported {rows} rows to {final_filepath}. Memory high-water mark: {get_memory_high_water_mark()}')
 
     def run(self) -> None:
-        ExtractForex(assets=self._assets['forex'], start_year=self._start_year, end_year=self._end_year).run()
+        ExtractForex(assets=self._assets['forex'], start_year=self._start_year, end_year=self._end_year, workers=self._workers,
+                     chunk_size_mb=self._chunk_size_mb).run()
         # TODO: Add crypto
         # TODO: Add commodities
         self._merge_data()
@@ -103,7 +129,10 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--start', '--inicio', dest='start_year', help='Extraction start year', type=int)
     parser.add_argument('-e', '--end', '--fin', dest='end_year', help='Extraction end year', type=int)
     parser.add_argument('-o', '--output', dest='output_format', help='Output file format', type=str)
+    parser.add_argument('-w', '--workers', dest='workers', help='Number of concurrent downloads and merge processes', type=int)
+    parser.add_argument('-c', '--chunk-size', dest='chunk_size_mb', help='Download chunk size in MB', type=float)
     args = parser.parse_args()
 
-    eh = ExtractionHandler(extraction_asset_list=args.assets, start_year=args.start_year, end_year=args.end_year, output_format=args.output_format)
+    eh = ExtractionHandler(extraction_asset_list=args.assets, start_year=args.start_year, end_year=args.end_year,
+                           output_format=args.output_format, workers=args.workers, chunk_size_mb=args.chunk_size_mb)
     eh.run()
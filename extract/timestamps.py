@@ -0,0 +1,23 @@
+import numpy as np
+import pyarrow
+import pyarrow.compute
+
+AXIORY_TIMESTAMP_FORMAT = '%Y.%m.%d %H:%M'
+TIMESTAMP_TYPE = pyarrow.timestamp('ns', tz='UTC')
+
+
+def parse_axiory_timestamp_array(date, hour) -> pyarrow.TimestampArray:
+    """
+        Parses the date ('2020.01.31') and hour ('23:59') string columns of the source into a typed UTC timestamp array
+        in a single vectorized pass with an explicit format, so no format inference or per-row Python code is involved.
+    """
+    date = date if isinstance(date, (pyarrow.Array, pyarrow.ChunkedArray)) else pyarrow.array(date, pyarrow.string())
+    hour = hour if isinstance(hour, (pyarrow.Array, pyarrow.ChunkedArray)) else pyarrow.array(hour, pyarrow.string())
+    timestamps = pyarrow.compute.strptime(pyarrow.compute.binary_join_element_wise(date, hour, ' '),
+                                          format=AXIORY_TIMESTAMP_FORMAT, unit='ns')
+    return timestamps.cast(TIMESTAMP_TYPE)
+
+
+def parse_axiory_timestamps(date, hour) -> np.ndarray:
+    """ Same as parse_axiory_timestamp_array but returning int64 nanoseconds since epoch (UTC) """
+    return parse_axiory_timestamp_array(date, hour).cast(pyarrow.int64()).to_numpy()
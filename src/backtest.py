@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from trading_rules import NEXT_POSITION, REWARD_WINDOW, get_account_balance_factors, get_rewards
+
+FLAT = 2
+HOLD = 2
+
+
+def scan_positions(actions: np.array, initial_position: int = FLAT) -> np.array:
+    """
+        Positions after every action computed with a prefix scan instead of a loop. Each action is a transition of the
+        three positions and transitions compose associatively, so after log2(steps) vectorized rounds of composing every
+        prefix with the one shift steps before, each step holds the composition of all the actions until it.
+    """
+    prefix_transitions = NEXT_POSITION.T[actions] #[..., step, posición anterior] -> posición después de la acción
+    shift = 1
+    while shift < actions.shape[-1]:
+        earlier_transitions = prefix_transitions[..., :-shift, :]
+        later_transitions = prefix_transitions[..., shift:, :]
+        prefix_transitions = np.concatenate((prefix_transitions[..., :shift, :], np.take_along_axis(later_transitions, earlier_transitions, axis=-1)), axis=-2)
+        shift *= 2
+    return prefix_transitions[..., initial_position]
+
+
+def backtest_arrays(close_prices: np.array, actions: np.array, initial_account_balance: float, trade_commission: float = 0.001) -> dict:
+    """
+        Runs the actions of an episode through the trading rules of SingleAssetTradingEnvironment._take_action in
+        vectorized passes. close_prices are the prices of the steps of the episode (close_prices[start_step:] of the
+        environment) and actions has one action per step on its last axis, so several action sequences can be tested
+        at once over the same prices. Balances are accumulated with sequential products, so they are identical to the ones
+        of the environment and not only close to them. The episode isn't terminated if the balance reaches 0.
+
+        As in the environment, the action of the first step isn't processed and the reward of each step is -1 for
+        buying while long or selling while short, otherwise the return over the last REWARD_WINDOW steps.
+    """
+    close_prices = np.asarray(close_prices, dtype=np.float64)
+    actions = np.asarray(actions, dtype=np.int8).copy()
+    steps = actions.shape[-1]
+    actions[..., 0] = HOLD #el primer step no procesa la acción
+
+    positions = scan_positions(actions)
+    previous_positions = np.concatenate((np.full(positions.shape[:-1] + (1,), FLAT, dtype=positions.dtype), positions[..., :-1]), axis=-1)
+    current_prices = close_prices[:steps]
+    previous_prices = np.concatenate((close_prices[:1], close_prices[:steps - 1]))
+
+    account_balance_factors = get_account_balance_factors(previous_positions, actions, previous_prices, current_prices, trade_commission)
+    account_balance_history = np.multiply.accumulate(
+        np.concatenate((np.full(actions.shape[:-1] + (1,), float(initial_account_balance)), account_balance_factors), axis=-1), axis=-1
+    )
+    account_balances = account_balance_history[..., 1:]
+
+    #después del step k el historial tiene k + 1 balances, la referencia del reward es el de max(k + 1 - REWARD_WINDOW, 0)
+    rolling_account_balances = account_balance_history[..., np.maximum(np.arange(1, steps + 1) - REWARD_WINDOW + 1, 0)]
+    rewards = get_rewards(positions, actions, account_balances, rolling_account_balances)
+
+    traded = (positions != previous_positions)
+    commissions = np.where(traded, account_balance_history[..., :-1] * account_balance_factors / (1 - trade_commission) * trade_commission, 0.0)
+
+    return {
+        "ACCOUNT_BALANCE": account_balances,
+        "POSITION": positions,
+        "ACTION": actions,
+        "PRICE": np.broadcast_to(current_prices, actions.shape),
+        "COMMISSION": commissions,
+        "TOTAL_RETURNS": account_balances / initial_account_balance - 1,
+        "REWARD": rewards,
+        "TOTAL_REWARDS": np.cumsum(rewards, axis=-1)
+    }
+
+
+def backtest(close_prices: np.array, actions: np.array, initial_account_balance: float, trade_commission: float = 0.001) -> pd.DataFrame:
+    """ backtest_arrays of a single action sequence as a DataFrame with a row per step, until the balance reaches 0 """
+    results = pd.DataFrame(backtest_arrays(close_prices, actions, initial_account_balance, trade_commission))
+    bankrupt_steps = np.flatnonzero(results["ACCOUNT_BALANCE"].to_numpy() <= 0)
+    return results if bankrupt_steps.shape[0] == 0 else results.iloc[:bankrupt_steps[0] + 1]
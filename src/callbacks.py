@@ -0,0 +1,18 @@
+from ray.rllib.algorithms.callbacks import DefaultCallbacks
+
+
+def get_last_info(episode) -> dict:
+    """ Info of the last step of a single agent episode """
+    if hasattr(episode, "last_info_for"):
+        return episode.last_info_for() or {}
+    #EpisodeV2 (el sampler por defecto desde ray 2.x) solo guarda el último info de cada agente
+    return next(iter(episode._last_infos.values()), {})
+
+
+class TradingMetricsCallbacks(DefaultCallbacks):
+    """ Reports the step metrics of the instrumented environments as RLlib custom metrics at the end of every episode """
+
+    def on_episode_end(self, *, worker, base_env, policies, episode, env_index=None, **kwargs) -> None:
+        step_metrics = get_last_info(episode).get("STEP METRICS", {})
+        for name, value in step_metrics.items():
+            episode.custom_metrics[name] = value
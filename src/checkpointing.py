@@ -0,0 +1,127 @@
+import os
+import copy
+import json
+import time
+import shutil
+import logging
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+CHECKPOINT_PREFIX = "checkpoint_"
+METADATA_FILENAME = "metadata.json"
+
+logger = logging.getLogger(__name__)
+
+
+class AlgorithmSnapshot:
+    """ Copy of the state of an Algorithm that its save_checkpoint writes as if it were the algorithm itself """
+
+    def __init__(self, algorithm, state: dict):
+        self._algorithm = algorithm
+        self._state = state
+
+    def __getstate__(self) -> dict:
+        return self._state
+
+    def get_policy(self, policy_id: str):
+        #solo para exportar su policy_state ya copiado
+        return self._algorithm.get_policy(policy_id)
+
+
+class Checkpointer:
+    """
+        Saves the state of an RLlib Algorithm off the training thread. The training thread only takes a deep copy of the
+        state, then a background thread writes it with Algorithm.save_checkpoint into a temporal folder that is renamed
+        into place, so a checkpoint is either complete or not there at all and it can be loaded with the RLlib API too.
+        Only the last keep_last checkpoints and the one with the best reward are kept. At most one checkpoint is written
+        at a time, if the previous one is still being written the next save waits for it.
+
+        The checkpoints of the folder belong to a single run: unless resuming, the folder can't have checkpoints.
+    """
+
+    def __init__(self, checkpoint_path: str, keep_last: int = 5, resume: bool = False):
+        self.checkpoint_path = os.path.abspath(checkpoint_path)
+        self.keep_last = keep_last
+        self.best_reward = None
+        self.best_checkpoint = None
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        checkpoints = self.get_checkpoints()
+        if not resume and len(checkpoints) > 0:
+            raise ValueError(f"{self.checkpoint_path} has checkpoints of another run, resume it or use another folder")
+        for checkpoint in checkpoints:
+            reward = self.read_metadata(checkpoint)["reward"]
+            if self.best_reward is None or reward > self.best_reward:
+                self.best_reward, self.best_checkpoint = reward, checkpoint
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpointer")
+        self._pending: Optional[Future] = None
+
+    def get_checkpoints(self) -> List[str]:
+        """ Complete checkpoints from the oldest to the latest, by the time they were saved """
+        checkpoints = [os.path.join(self.checkpoint_path, name) for name in os.listdir(self.checkpoint_path)
+                       if name.startswith(CHECKPOINT_PREFIX) and not name.endswith(".tmp")]
+        checkpoints = [checkpoint for checkpoint in checkpoints if os.path.isfile(os.path.join(checkpoint, METADATA_FILENAME))]
+        return sorted(checkpoints, key=lambda checkpoint: self.read_metadata(checkpoint)["time"])
+
+    @staticmethod
+    def read_metadata(checkpoint: str) -> dict:
+        with open(os.path.join(checkpoint, METADATA_FILENAME), "r") as metadata_file:
+            return json.load(metadata_file)
+
+    def wait(self) -> None:
+        """ Waits for the checkpoint being written, raising its error if it failed """
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def save(self, algorithm, episode: int, reward: float) -> str:
+        """ Snapshots the state of the algorithm and writes it in the background. Returns the path of the checkpoint """
+        self.wait()
+        #los pesos de las policies comparten memoria con los tensores que sigue entrenando el algoritmo
+        state = copy.deepcopy(algorithm.__getstate__())
+        metadata = {"episode": episode, "iteration": algorithm.iteration, "reward": reward, "time": time.time()}
+        checkpoint = os.path.join(self.checkpoint_path, f"{CHECKPOINT_PREFIX}{episode:06d}")
+        self._pending = self._executor.submit(self._write, type(algorithm), AlgorithmSnapshot(algorithm, state), metadata, checkpoint)
+        return checkpoint
+
+    def _write(self, algorithm_class, snapshot: AlgorithmSnapshot, metadata: dict, checkpoint: str) -> None:
+        temporal_path = f"{checkpoint}.tmp"
+        shutil.rmtree(temporal_path, ignore_errors=True)
+        os.makedirs(temporal_path)
+        algorithm_class.save_checkpoint(snapshot, temporal_path)
+        with open(os.path.join(temporal_path, METADATA_FILENAME), "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+        shutil.rmtree(checkpoint, ignore_errors=True) #al reanudar desde un checkpoint que no es el último se sobrescriben los siguientes
+        os.replace(temporal_path, checkpoint)
+
+        if self.best_reward is None or metadata["reward"] > self.best_reward:
+            self.best_reward, self.best_checkpoint = metadata["reward"], checkpoint
+        self._prune()
+        logger.info(f"Checkpoint of episode {metadata['episode']} saved in {checkpoint}")
+
+    def _prune(self) -> None:
+        checkpoints = self.get_checkpoints()
+        for checkpoint in checkpoints[:-self.keep_last] if self.keep_last > 0 else checkpoints:
+            if checkpoint != self.best_checkpoint:
+                shutil.rmtree(checkpoint, ignore_errors=True)
+
+    def restore(self, algorithm, checkpoint: str = None) -> Optional[dict]:
+        """
+            Restores the algorithm from the checkpoint, the latest one if not given. Returns the metadata of the
+            checkpoint, None if there is no checkpoint to resume from.
+        """
+        self.wait()
+        checkpoints = self.get_checkpoints()
+        if checkpoint is None and len(checkpoints) == 0:
+            return None
+        checkpoint = checkpoints[-1] if checkpoint is None else checkpoint
+        algorithm.load_checkpoint(checkpoint)
+        logger.info(f"Resumed from {checkpoint}")
+        return self.read_metadata(checkpoint)
+
+    def close(self) -> None:
+        """ Waits for the last checkpoint to be written and stops the background thread """
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
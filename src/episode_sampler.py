@@ -0,0 +1,106 @@
+import os
+import sys
+import numpy as np
+
+from typing import Optional, Sequence, Tuple, Union
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+
+NANOSECONDS_PER_MINUTE = 60 * 10 ** 9
+MAX_WEEKEND_CLOSURE_MINUTES = 3 * 24 * 60 #de la última vela del viernes a la primera del lunes con velas diarias
+
+
+def get_episode_seed(env_config: dict, index: int = 0) -> Optional[Tuple[int, ...]]:
+    """ Seed of the episodes of an environment: the "seed" of the config combined with the RLlib worker and env indexes """
+    if env_config.get("seed") is None:
+        return None
+    return (env_config["seed"], getattr(env_config, "worker_index", 0), getattr(env_config, "vector_index", 0), index)
+
+
+class EpisodeSampler:
+    """
+        Chooses the first and the last step of every episode. The steps an episode can start at are precomputed once:
+        the observation window and at least the minimum episode length have to fit inside a segment of the data without
+        unexpected gaps (missing data found in the timestamps), so an episode never spans one. Weekend closures of the
+        market are not gaps: episodes and observation windows continue across them as if the market never closed.
+        Starts are drawn at random when random_start is set, otherwise every episode starts where the previous one ended.
+
+        episode_length is the number of steps of an episode: a fixed value, a (minimum, maximum) range to draw it from,
+        or None to run until the end of the segment. Without random starts nor episode length the whole data is a single
+        episode, as the environments always did.
+    """
+
+    def __init__(self, rows: int, window_size: int, timestamps: Optional[np.array] = None,
+                 episode_length: Union[int, Sequence[int], None] = None, random_start: bool = False,
+                 seed: Optional[Tuple[int, ...]] = None, max_gap_minutes: int = config.QUALITY_SESSION_GAP_MINUTES):
+        if episode_length is None or np.isscalar(episode_length):
+            self.min_episode_length, self.max_episode_length = episode_length, episode_length
+        else:
+            self.min_episode_length, self.max_episode_length = episode_length
+        self.random_start = random_start
+        self.random_generator = np.random.default_rng(seed)
+
+        split_on_gaps = timestamps is not None and (random_start or episode_length is not None)
+        segment_starts, segment_ends = self._get_segments(rows, timestamps if split_on_gaps else None, max_gap_minutes)
+        valid_starts, valid_start_segment_ends = [], []
+        for segment_start, segment_end in zip(segment_starts, segment_ends):
+            #el último step del episodio es como mucho la última vela del segmento
+            segment_valid_starts = np.arange(segment_start + window_size, segment_end - (self.min_episode_length or 1) + 1)
+            valid_starts.append(segment_valid_starts)
+            valid_start_segment_ends.append(np.full(segment_valid_starts.shape[0], segment_end))
+        self.valid_starts = np.concatenate(valid_starts)
+        self.valid_start_segment_ends = np.concatenate(valid_start_segment_ends)
+        if self.valid_starts.shape[0] == 0:
+            raise ValueError(f"No episode of {self.min_episode_length or 1} steps and a window of {window_size} fits in the data")
+
+        self.next_start_index = 0
+
+    @staticmethod
+    def _get_segments(rows: int, timestamps: Optional[np.array], max_gap_minutes: int) -> Tuple[np.array, np.array]:
+        """
+            First and last row of every segment of the data without unexpected gaps. A jump between bars longer than
+            max_gap_minutes is a gap unless it is a weekend closure: it includes a Saturday (UTC) and doesn't last more
+            than MAX_WEEKEND_CLOSURE_MINUTES plus the maximum gap.
+        """
+        if timestamps is None or rows < 2:
+            return np.array([0]), np.array([rows - 1])
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        timestamp_differences = np.diff(timestamps)
+        #con velas de más de max_gap_minutes (1D) solo son huecos los que faltan más de media vela
+        max_gap = max(max_gap_minutes * NANOSECONDS_PER_MINUTE, 1.5 * np.median(timestamp_differences))
+        gaps = np.flatnonzero(timestamp_differences > max_gap)
+
+        gap_start_days = timestamps[gaps].astype("datetime64[ns]").astype("datetime64[D]")
+        gap_end_days = timestamps[gaps + 1].astype("datetime64[ns]").astype("datetime64[D]")
+        includes_saturday = np.busday_count(gap_start_days, gap_end_days + 1, weekmask="0000010") > 0
+        weekend_closures = includes_saturday & (timestamp_differences[gaps] <= MAX_WEEKEND_CLOSURE_MINUTES * NANOSECONDS_PER_MINUTE + max_gap)
+        gaps = gaps[~weekend_closures]
+        return np.concatenate(([0], gaps + 1)), np.concatenate((gaps, [rows - 1]))
+
+    @property
+    def longest_episode_length(self) -> int:
+        """ Maximum number of steps an episode can have, to size the buffers of the environments """
+        longest_episode_length = int((self.valid_start_segment_ends - self.valid_starts).max())
+        return longest_episode_length if self.max_episode_length is None else min(longest_episode_length, self.max_episode_length)
+
+    def seed(self, seed: Optional[int]) -> None:
+        self.random_generator = np.random.default_rng(seed)
+
+    def sample(self) -> Tuple[int, int]:
+        """ Returns the step the episode starts at and the step it terminates at """
+        if self.random_start:
+            start_index = self.random_generator.integers(self.valid_starts.shape[0])
+        else:
+            start_index = self.next_start_index
+        start_step = int(self.valid_starts[start_index])
+        end_step = int(self.valid_start_segment_ends[start_index])
+
+        if self.max_episode_length is not None:
+            episode_length = self.random_generator.integers(self.min_episode_length, self.max_episode_length + 1)
+            end_step = min(start_step + int(episode_length), end_step)
+
+        if not self.random_start:
+            #el siguiente episodio empieza donde acaba este, o vuelve al principio de los datos
+            self.next_start_index = int(np.searchsorted(self.valid_starts, end_step)) % self.valid_starts.shape[0]
+        return start_step, end_step
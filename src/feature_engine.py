@@ -0,0 +1,167 @@
+import json
+import math
+import numpy as np
+import pandas as pd
+
+from typing import Tuple
+
+FEATURE_NAMES = ("DENOISED", "SLOPE", "CURVATURE", "VOLATILITY")
+
+
+class EwmUpdater:
+    """
+        Exponentially weighted mean with adjust=True updated one value at a time. It keeps the same state and does the
+        same floating point operations as pandas' ewm(alpha=alpha).mean(), so the results are identical to it, also when
+        there are NaN values: the last mean is carried over them.
+    """
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.weighted = math.nan
+        self.old_weight = 0.0
+
+    def update(self, value: float) -> float:
+        if self.weighted != self.weighted: #todavía no hay ningún valor
+            if value == value:
+                self.weighted = value
+                self.old_weight = 1.0
+            return self.weighted
+        #como en pandas (ignore_na=False) un NaN no cambia la media pero los valores anteriores pierden peso igualmente
+        self.old_weight *= 1 - self.alpha
+        if value == value:
+            if self.weighted != value:
+                self.weighted = ((self.old_weight * self.weighted) + value) / (self.old_weight + 1.0)
+            self.old_weight += 1.0
+        return self.weighted
+
+    def get_state(self) -> dict:
+        return {"alpha": self.alpha, "weighted": self.weighted, "old_weight": self.old_weight}
+
+    def set_state(self, state: dict) -> None:
+        self.alpha, self.weighted, self.old_weight = state["alpha"], state["weighted"], state["old_weight"]
+
+
+class DifferenceUpdater:
+    """ Causal first difference: the current value minus the previous one, NaN for the first value """
+
+    def __init__(self):
+        self.previous_value = math.nan
+
+    def update(self, value: float) -> float:
+        difference = value - self.previous_value
+        self.previous_value = value
+        return difference
+
+    def get_state(self) -> dict:
+        return {"previous_value": self.previous_value}
+
+    def set_state(self, state: dict) -> None:
+        self.previous_value = state["previous_value"]
+
+
+class RollingVolatilityUpdater:
+    """
+        Sample standard deviation of the log returns of the last window prices. Mean and sum of squared deviations are
+        updated with Welford's algorithm when a return enters and leaves the window, so each update is O(1). NaN until
+        the window is full.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.returns = [0.0] * window #buffer circular con los retornos de la ventana
+        self.position = 0
+        self.count = 0
+        self.mean = 0.0
+        self.squared_deviations = 0.0
+        self.previous_price = math.nan
+
+    def update(self, price: float) -> float:
+        log_return = math.log(price / self.previous_price) if self.previous_price == self.previous_price else math.nan
+        self.previous_price = price
+        if log_return != log_return:
+            return math.nan
+
+        if self.count == self.window:
+            leaving_return = self.returns[self.position]
+            self.count -= 1
+            delta = leaving_return - self.mean
+            self.mean -= delta / self.count
+            self.squared_deviations -= delta * (leaving_return - self.mean)
+        self.returns[self.position] = log_return
+        self.position = (self.position + 1) % self.window
+        self.count += 1
+        delta = log_return - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (log_return - self.mean)
+
+        if self.count < self.window:
+            return math.nan
+        return math.sqrt(max(self.squared_deviations, 0.0) / (self.count - 1))
+
+    def get_state(self) -> dict:
+        return {
+            "window": self.window, "returns": list(self.returns), "position": self.position, "count": self.count,
+            "mean": self.mean, "squared_deviations": self.squared_deviations, "previous_price": self.previous_price
+        }
+
+    def set_state(self, state: dict) -> None:
+        self.window, self.returns, self.position, self.count = state["window"], list(state["returns"]), state["position"], state["count"]
+        self.mean, self.squared_deviations, self.previous_price = state["mean"], state["squared_deviations"], state["previous_price"]
+
+
+class FeatureEngine:
+    """
+        Denoising features of a close price series computed bar by bar in O(1): the EWM of the close (DENOISED), its
+        slope and curvature (causal first and second differences, np.gradient would need the next bar) and the rolling
+        volatility of the log returns. The state can be checkpointed and restored, so a live loop continues exactly where
+        the training data ended. Batch mode runs the same updaters, so its features are identical to the streamed ones.
+    """
+
+    def __init__(self, alpha: float = 0.01, volatility_window: int = 60):
+        self.denoised = EwmUpdater(alpha)
+        self.slope = DifferenceUpdater()
+        self.curvature = DifferenceUpdater()
+        self.volatility = RollingVolatilityUpdater(volatility_window)
+
+    def update(self, close: float) -> Tuple[float, float, float, float]:
+        denoised = self.denoised.update(close)
+        slope = self.slope.update(denoised)
+        return denoised, slope, self.curvature.update(slope), self.volatility.update(close)
+
+    def transform(self, closes: np.array) -> np.array:
+        """ Features (bars, FEATURE_NAMES) of a batch of closes, continuing from the current state of the engine """
+        features = np.empty((len(closes), len(FEATURE_NAMES)))
+        update = self.update
+        for index, close in enumerate(np.asarray(closes, dtype=np.float64).tolist()):
+            features[index] = update(close)
+        return features
+
+    def transform_df(self, closes: pd.Series) -> pd.DataFrame:
+        return pd.DataFrame(self.transform(closes.to_numpy()), index=closes.index, columns=FEATURE_NAMES)
+
+    def get_state(self) -> dict:
+        return {
+            "denoised": self.denoised.get_state(),
+            "slope": self.slope.get_state(),
+            "curvature": self.curvature.get_state(),
+            "volatility": self.volatility.get_state()
+        }
+
+    def set_state(self, state: dict) -> None:
+        self.denoised.set_state(state["denoised"])
+        self.slope.set_state(state["slope"])
+        self.curvature.set_state(state["curvature"])
+        self.volatility.set_state(state["volatility"])
+
+    def save_checkpoint(self, path: str) -> None:
+        #json guarda los floats con repr, al restaurarlos son exactamente los mismos
+        with open(path, "w") as checkpoint_file:
+            json.dump(self.get_state(), checkpoint_file)
+
+    @classmethod
+    def load_checkpoint(cls, path: str) -> "FeatureEngine":
+        with open(path, "r") as checkpoint_file:
+            state = json.load(checkpoint_file)
+        feature_engine = cls(state["denoised"]["alpha"], state["volatility"]["window"])
+        feature_engine.set_state(state)
+        return feature_engine
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import hashlib
+import pandas as pd
+import pyarrow
+import pyarrow.ipc
+
+from typing import Callable
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import config
+
+INDEX_FILENAME = "index.json"
+ENTRY_EXTENSION = ".arrow"
+
+
+class FeatureStore:
+    """
+        Disk cache of computed feature matrices. Each entry is an uncompressed Arrow IPC file, read as a memory map, so a
+        hit costs neither parsing nor a copy. Entries are content addressed: the key is a hash of the version of the
+        source data, the asset, the timeframe and the feature spec, so a change in any of them is a different entry and
+        stale ones are never read. When the store grows over max_size_mb the least recently used entries are evicted.
+
+        The files themselves are the state of the store, so every process (each rollout worker has its own instance)
+        sees the entries the others wrote and the size limit holds for all of them together: the size is measured from
+        the directory and the last access of an entry is the modification time of its file. index.json only describes the
+        entries (asset, timeframe and feature spec) and is only written when an entry is added.
+    """
+
+    def __init__(self, store_path: str, max_size_mb: float = config.FEATURE_STORE_MAX_SIZE_MB):
+        self.store_path = store_path
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(store_path, exist_ok=True)
+
+    @staticmethod
+    def get_key(source_version: str, asset: str, timeframe: str, feature_spec: dict) -> str:
+        key_content = json.dumps([source_version, asset, timeframe, feature_spec], sort_keys=True)
+        return hashlib.sha256(key_content.encode()).hexdigest()[:32]
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self.store_path, f"{key}{ENTRY_EXTENSION}")
+
+    def _get_entries(self) -> dict:
+        """ Size and last access of every entry in the store, whichever process wrote it """
+        entries = dict()
+        with os.scandir(self.store_path) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.name.endswith(ENTRY_EXTENSION):
+                    try:
+                        file_stat = directory_entry.stat()
+                    except FileNotFoundError:
+                        continue #evicted por otro proceso
+                    entries[directory_entry.name[:-len(ENTRY_EXTENSION)]] = {"size": file_stat.st_size, "last_access": file_stat.st_mtime}
+        return entries
+
+    def _update_index(self, key: str, description: dict) -> None:
+        index_path = os.path.join(self.store_path, INDEX_FILENAME)
+        try:
+            with open(index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = dict()
+        index[key] = description
+        entries = self._get_entries()
+        index = {index_key: index_description for index_key, index_description in index.items() if index_key in entries}
+
+        temporal_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temporal_path, "w") as index_file:
+            json.dump(index, index_file, indent=2)
+        os.replace(temporal_path, index_path)
+
+    @staticmethod
+    def _read_entry(entry_path: str) -> pyarrow.Table:
+        return pyarrow.ipc.open_file(pyarrow.memory_map(entry_path, "r")).read_all()
+
+    def get(self, source_version: str, asset: str, timeframe: str, feature_spec: dict, compute: Callable[[], pd.DataFrame]) -> pyarrow.Table:
+        """ Returns the features of the key from the store, computing them with compute() and storing them on a miss """
+        key = self.get_key(source_version, asset, timeframe, feature_spec)
+        entry_path = self._get_entry_path(key)
+        try:
+            table = self._read_entry(entry_path)
+            os.utime(entry_path) #último acceso, sin reescribir el índice
+            self.hits += 1
+            return table
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        table = pyarrow.Table.from_pandas(compute(), preserve_index=False)
+        temporal_path = f"{entry_path}.{os.getpid()}.tmp"
+        with pyarrow.OSFile(temporal_path, "wb") as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temporal_path, entry_path)
+
+        self._evict(keep_key=key)
+        self._update_index(key, {"asset": asset, "timeframe": timeframe, "feature_spec": feature_spec})
+        return self._read_entry(entry_path)
+
+    def _evict(self, keep_key: str) -> None:
+        #las entradas ya mapeadas por otro proceso siguen siendo legibles después de borrar el fichero
+        entries = self._get_entries()
+        total_size = sum(entry["size"] for entry in entries.values())
+        for key in sorted(entries, key=lambda entry_key: entries[entry_key]["last_access"]):
+            if total_size <= self.max_size_bytes:
+                break
+            if key == keep_key:
+                continue
+            total_size -= entries[key]["size"]
+            try:
+                os.remove(self._get_entry_path(key))
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> dict:
+        requests = self.hits + self.misses
+        entries = self._get_entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "size_mb": sum(entry["size"] for entry in entries.values()) / 1024 / 1024
+        }
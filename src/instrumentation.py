@@ -0,0 +1,91 @@
+import time
+import numpy as np
+
+from typing import Callable, List, Sequence, Tuple
+
+HISTOGRAM_BUCKETS = 48 #bucket i: latencias de i bits, entre 2^(i-1) y 2^i - 1 nanosegundos
+HISTOGRAM_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class StepMetrics:
+    """
+        Calls, total time and a latency histogram of every instrumented phase of an environment. Phases are timed by
+        wrapping the methods of the environment with timed(), so when the instrumentation is disabled the environment
+        runs its methods without any overhead. Histogram buckets are powers of two, recording a latency is O(1).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = {}
+        self.total_nanoseconds = {}
+        self.histograms = {}
+
+    def record(self, phase: str, nanoseconds: int) -> None:
+        if phase not in self.histograms:
+            self.calls[phase] = 0
+            self.total_nanoseconds[phase] = 0
+            self.histograms[phase] = [0] * HISTOGRAM_BUCKETS
+        self.calls[phase] += 1
+        self.total_nanoseconds[phase] += nanoseconds
+        self.histograms[phase][min(nanoseconds.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def timed(self, phase: str, function: Callable) -> Callable:
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter_ns()
+            result = function(*args, **kwargs)
+            self.record(phase, time.perf_counter_ns() - start)
+            return result
+        return timed_function
+
+    def get_metrics(self) -> dict:
+        """ Calls, mean and quantile latencies (upper bound of the histogram bucket) of each phase, in microseconds """
+        metrics = {}
+        for phase, histogram in self.histograms.items():
+            metrics[f"{phase}_calls"] = self.calls[phase]
+            metrics[f"{phase}_mean_us"] = self.total_nanoseconds[phase] / self.calls[phase] / 1000
+            cumulative_histogram = np.cumsum(histogram)
+            for quantile in HISTOGRAM_QUANTILES:
+                bucket = int(np.searchsorted(cumulative_histogram, quantile * self.calls[phase]))
+                metrics[f"{phase}_p{int(quantile * 100)}_us"] = (2 ** bucket) / 1000
+        return metrics
+
+
+class InstrumentedEnvironment:
+    """
+        Mixin of the environments with optional step instrumentation. With "instrumentation" in the config the methods of
+        each phase and the step are replaced by timed versions, without it nothing is wrapped and it costs nothing. The
+        metrics of the episode are returned in the info of its last step and passed to the "metrics_callback" if any.
+    """
+
+    def _setup_instrumentation(self, config: dict, phase_methods: Sequence[Tuple[str, str]], step_method: str = "step") -> None:
+        """ phase_methods are the (phase, method name) pairs to time, step_method is the step of the environment """
+        self.metrics_callback = config.get("metrics_callback")
+        self.step_metrics = StepMetrics() if config.get("instrumentation", False) else None
+        if self.step_metrics is None:
+            return
+        for phase, method in phase_methods:
+            setattr(self, method, self.step_metrics.timed(phase, getattr(self, method)))
+        timed_step = self.step_metrics.timed("step", getattr(self, step_method))
+
+        def instrumented_step(*args, **kwargs):
+            #las métricas se devuelven después de cronometrar el step, así la latencia del último step entra en su episodio
+            observation, reward, terminated, truncated, info = timed_step(*args, **kwargs)
+            if isinstance(terminated, list): #un VectorEnv devuelve una lista por sub environment
+                self._report_step_metrics([info[index] for index in np.flatnonzero(terminated)])
+            elif terminated:
+                self._report_step_metrics([info])
+            return observation, reward, terminated, truncated, info
+        setattr(self, step_method, instrumented_step)
+
+    def _report_step_metrics(self, terminated_infos: List[dict]) -> None:
+        """ Adds the metrics to the infos of the episodes that terminated in the step and starts measuring again """
+        if len(terminated_infos) == 0:
+            return
+        step_metrics = self.step_metrics.get_metrics()
+        for info in terminated_infos:
+            info["STEP METRICS"] = step_metrics
+        if self.metrics_callback is not None:
+            self.metrics_callback(step_metrics)
+        self.step_metrics.reset()
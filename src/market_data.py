@@ -0,0 +1,160 @@
+import os
+import sys
+import pandas as pd
+import numpy as np
+
+from typing import List, Optional, Tuple
+
+PROJECT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_PATH)
+sys.path.append(os.path.join(PROJECT_PATH, "extract"))
+from dataset import load_bars, _to_utc_timestamp
+from resample import get_bars
+from panel import Panel, PRICE_FIELDS, build_panel, get_panel
+from resample import get_source_hash
+from feature_engine import FeatureEngine
+from feature_store import FeatureStore
+
+NORMALIZATION_FACTOR = 999999
+MARKET_STATE_COLUMNS = ["open", "high", "min", "close"]
+MARKET_STATES_FILENAME = "market_states.npy"
+CLOSE_PRICES_FILENAME = "close_prices.npy"
+TIMESTAMPS_FILENAME = "timestamps.npy"
+PRICE_FEATURES = ["open", "high", "min", "close", "DENOISED"] #en unidades de precio, se normalizan con NORMALIZATION_FACTOR
+DEFAULT_FEATURE_STORE_PATH = os.path.join(PROJECT_PATH, "data", "cache", "features")
+
+_feature_stores = {}
+
+
+def load_market_data(config: dict) -> pd.DataFrame:
+    if "dataset_path" in config and config.get("timeframe", "1m") != "1m":
+        #las velas de la temporalidad pedida salen de la caché, solo se calculan si el dataset del activo ha cambiado
+        bars = get_bars(config["asset"], config["timeframe"], dataset_path=config["dataset_path"])
+        if config.get("start") is not None:
+            bars = bars[bars["date"] >= _to_utc_timestamp(config["start"])]
+        if config.get("end") is not None:
+            bars = bars[bars["date"] < _to_utc_timestamp(config["end"])]
+        return bars.rename(columns={"low": "min"})[["date","open","high","close","min"]].reset_index(drop=True)
+    elif "dataset_path" in config:
+        #solo se leen las particiones y row groups del activo y rango de fechas pedidos
+        bars = load_bars([config["asset"]], config.get("start"), config.get("end"), ["open", "high", "low", "close"], dataset_path=config["dataset_path"])
+        return bars.rename(columns={"low": "min"})[["date","open","high","close","min"]]
+    else:
+        df = pd.read_csv(config["data_path"])
+        return df[[column for column in ("date","open","high","close","min") if column in df.columns]]
+
+
+def load_market_panel(config: dict) -> Panel:
+    """ Panel with the prices of the "assets" of the config aligned on the same clock, with the fill policy of the config """
+    fill, max_fill_bars = config.get("fill", "ffill"), config.get("max_fill_bars")
+    if "dataset_path" in config:
+        #el panel sale de la caché, solo se construye si las particiones de algún activo han cambiado
+        return get_panel(config["assets"], config.get("timeframe", "1m"), PRICE_FIELDS, fill, max_fill_bars,
+                         config.get("start"), config.get("end"), dataset_path=config["dataset_path"])
+    #fichero mergeado con la columna asset (csv o parquet)
+    bars = pd.read_parquet(config["data_path"]) if config["data_path"].endswith(".parquet") else pd.read_csv(config["data_path"])
+    return build_panel(bars.rename(columns={"min": "low"}), config["assets"], PRICE_FIELDS, fill, max_fill_bars)
+
+
+def get_multi_asset_market_arrays(panel: Panel) -> Tuple[np.array, np.array, np.array]:
+    """
+        Same arrays as get_market_arrays for several assets on the same clock: market states (time, asset, feature),
+        close prices (time, asset) and the timestamps. Only the times where every asset has a bar (real or filled) are kept.
+    """
+    complete_rows = ~np.isnan(panel.values).any(axis=(1, 2))
+    prices = panel.values[complete_rows]
+    market_states = np.ascontiguousarray(prices.astype(np.float32) / np.float32(NORMALIZATION_FACTOR))
+    close_prices = np.ascontiguousarray(prices[:, :, PRICE_FIELDS.index("close")])
+    return market_states, close_prices, np.asarray(panel.timestamps[complete_rows])
+
+
+def get_feature_store(feature_store_path: str) -> FeatureStore:
+    """ One feature store per path and process, so the hit/miss stats include every environment of the worker """
+    if feature_store_path not in _feature_stores:
+        _feature_stores[feature_store_path] = FeatureStore(feature_store_path)
+    return _feature_stores[feature_store_path]
+
+
+def get_source_version(config: dict) -> str:
+    """ Version of the data the features are computed from, it changes whenever the source does """
+    if "dataset_path" in config:
+        return f"{get_source_hash(config['asset'], config['dataset_path'])}:{config.get('start')}:{config.get('end')}"
+    file_stat = os.stat(config["data_path"])
+    return f"{os.path.abspath(config['data_path'])}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+
+
+def compute_features(config: dict) -> pd.DataFrame:
+    """ Bars of the config with the features of FeatureEngine, with the parameters of the "features" spec """
+    feature_spec = config["features"]
+    df = load_market_data(config).reset_index(drop=True)
+    feature_engine = FeatureEngine(feature_spec.get("alpha", 0.01), feature_spec.get("volatility_window", 60))
+    features = feature_engine.transform_df(df["close"])
+    columns = ([column for column in ("date", "close") if column in df.columns] +
+               [column for column in feature_spec["columns"] if column not in ("date", "close")])
+    return pd.concat([df, features], axis=1)[columns]
+
+
+def load_feature_data(config: dict) -> pd.DataFrame:
+    """ Feature columns of the "features" spec of the config, from the feature store or computed and stored on a miss """
+    feature_store = get_feature_store(config.get("feature_store_path", DEFAULT_FEATURE_STORE_PATH))
+    asset = config.get("asset", os.path.basename(config.get("data_path", "")))
+    table = feature_store.get(get_source_version(config), asset, config.get("timeframe", "1m"), config["features"], lambda: compute_features(config))
+    return table.to_pandas()
+
+
+def get_market_arrays(df: pd.DataFrame, columns: List[str] = MARKET_STATE_COLUMNS) -> Tuple[np.array, np.array, Optional[np.array]]:
+    """
+        Market states (the columns as a contiguous float32 array, the ones in price units normalized), close prices
+        (float64) and timestamps (int64 UTC nanoseconds, None if the data has no dates) that the environments read from.
+        Features without enough history at the beginning of the data (NaN) are observed as 0.
+    """
+    market_states = np.ascontiguousarray(df[columns].to_numpy(dtype=np.float32))
+    price_columns = [index for index, column in enumerate(columns) if column in PRICE_FEATURES]
+    market_states[:, price_columns] /= np.float32(NORMALIZATION_FACTOR)
+    market_states = np.nan_to_num(market_states, copy=False)
+    close_prices = np.ascontiguousarray(df["close"].to_numpy(dtype=np.float64))
+    timestamps = pd.to_datetime(df["date"], utc=True).to_numpy(dtype="datetime64[ns]").view(np.int64) if "date" in df.columns else None
+    return market_states, close_prices, timestamps
+
+
+def build_market_data(config: dict, market_data_path: str) -> str:
+    """
+        Parses the market data of the config once and saves the arrays of the environments as .npy files in the
+        market_data_path folder, so every rollout worker maps them read-only with "market_data_path" instead of parsing
+        the source again and keeping its own copy.
+    """
+    os.makedirs(market_data_path, exist_ok=True)
+    for filename, array in zip((MARKET_STATES_FILENAME, CLOSE_PRICES_FILENAME, TIMESTAMPS_FILENAME), read_market_arrays(config)):
+        file_path = os.path.join(market_data_path, filename)
+        if array is None: #no quedan timestamps de un build anterior con fechas
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+            continue
+        temporal_path = f"{file_path}.tmp.npy"
+        np.save(temporal_path, array)
+        os.replace(temporal_path, file_path)
+    return market_data_path
+
+
+def load_market_arrays(config: dict) -> Tuple[np.array, np.array, Optional[np.array]]:
+    if "market_data_path" in config:
+        #el page cache del sistema operativo es compartido, todos los workers del nodo leen las mismas páginas
+        timestamps_path = os.path.join(config["market_data_path"], TIMESTAMPS_FILENAME)
+        return (np.load(os.path.join(config["market_data_path"], MARKET_STATES_FILENAME), mmap_mode="r"),
+                np.load(os.path.join(config["market_data_path"], CLOSE_PRICES_FILENAME), mmap_mode="r"),
+                np.load(timestamps_path, mmap_mode="r") if os.path.isfile(timestamps_path) else None)
+    elif "market_data_ref" in config:
+        #arrays guardados con ray.put((market_states, close_prices, timestamps)), ray.get los devuelve sin copiar desde el object store
+        import ray
+        return ray.get(config["market_data_ref"])
+    else:
+        return read_market_arrays(config)
+
+
+def read_market_arrays(config: dict) -> Tuple[np.array, np.array, Optional[np.array]]:
+    """ Parses the source of the config, a single asset or all the "assets" of the config on the same clock """
+    if "assets" in config:
+        return get_multi_asset_market_arrays(load_market_panel(config))
+    elif "features" in config:
+        return get_market_arrays(load_feature_data(config), config["features"]["columns"])
+    return get_market_arrays(load_market_data(config))
@@ -0,0 +1,192 @@
+import logging
+import gymnasium as gym
+import numpy as np
+
+from typing import Tuple, Optional
+from numpy.lib.stride_tricks import sliding_window_view
+from gymnasium.spaces import MultiDiscrete, Box
+
+from market_data import load_market_arrays, NORMALIZATION_FACTOR
+from episode_sampler import EpisodeSampler, get_episode_seed
+from instrumentation import InstrumentedEnvironment
+from trading_rules import ACTION_NAMES, NEXT_POSITION, POSITION_NAMES, REWARD_WINDOW, get_account_balance_factors, get_rewards
+
+
+class MultiAssetTradingEnvironment(InstrumentedEnvironment, gym.Env):
+    """
+        Trades the K "assets" of the config at once on the same clock. The account balance is split equally between the
+        assets and every asset follows the trading rules of SingleAssetTradingEnvironment with its own position, action
+        and balance, all of them arrays over the asset axis. The action is one action per asset, the reward the mean of
+        the rewards of the assets and the observation a (window_size + 1, K, features) tensor.
+    """
+    metadata = {'render.modes': ['human']}
+
+    def __init__(self, config: dict):
+        super(MultiAssetTradingEnvironment, self).__init__()
+
+        self.assets = list(config["assets"])
+        self.initial_account_balance = config["initial_account_balance"]
+        self.window_size = config["window_size"]
+        self.trade_commission = 0.001
+        self.normalization_factor = NORMALIZATION_FACTOR
+        self.copy_observations = config.get("copy_observations", True)
+        #con flatten_assets la observación es (window_size + 1, K * features), una matriz como la de un solo activo
+        self.flatten_assets = config.get("flatten_assets", False)
+
+        #market_states (tiempo, activo, feature) y close_prices (tiempo, activo), alineados en el mismo reloj
+        self.market_states, self.close_prices, timestamps = load_market_arrays(config)
+        self.market_state_windows = sliding_window_view(self.market_states, self.window_size + 1, axis=0).transpose(0, 3, 1, 2)
+        assets_count = len(self.assets)
+
+        self.initial_asset_balances = np.full(assets_count, self.initial_account_balance / assets_count)
+        self.asset_balances = self.initial_asset_balances.copy()
+        self.account_balance = self.initial_account_balance
+        self.current_positions = np.full(assets_count, 2, dtype=np.int8) #FLAT
+        self.current_actions = np.full(assets_count, 2, dtype=np.int8) #HOLD
+        self.total_returns = 0
+        self.total_rewards = 0
+        self.timestamp_reward = 0
+
+        self.episode_sampler = EpisodeSampler(
+            rows=self.close_prices.shape[0],
+            window_size=self.window_size,
+            timestamps=timestamps,
+            episode_length=config.get("episode_length"),
+            random_start=config.get("random_start", False),
+            seed=get_episode_seed(config)
+        )
+        self.current_step, self.end_step = self.window_size, self.close_prices.shape[0] - 1
+
+        #del historial de trading solo hacen falta los últimos precios y los últimos REWARD_WINDOW balances de cada activo
+        self.trading_history_length = 0
+        self.last_prices = np.zeros(assets_count)
+        self.asset_balance_history = np.zeros((REWARD_WINDOW, assets_count))
+
+        self.observation_buffer = np.empty((self.window_size + 1, assets_count, self.market_states.shape[2] + 3))
+
+        self._logger = logging.getLogger("environment_logger")
+        self._logger.setLevel(config.get("log_level", logging.INFO))
+        self.log_interval = config.get("log_interval", 0)
+
+        self._setup_instrumentation(config, [("take_action", "_take_action"), ("next_observation", "_next_observation")])
+
+        self._initialize_trading_history()
+        self._initialize_observation_agent_states()
+        self.action_space = MultiDiscrete([len(ACTION_NAMES)] * assets_count)
+        self.observation_space = self._define_observation_space()
+
+    def reset(self, seed: Optional[int] = None, options: Optional[dict] = None) -> Tuple[np.array, dict]:
+        super().reset(seed=seed)
+        if seed is not None:
+            self.episode_sampler.seed(seed)
+
+        self.current_positions[:] = 2 #FLAT
+        self.current_actions[:] = 2 #HOLD
+        self.asset_balances = self.initial_asset_balances.copy()
+        self.account_balance = self.initial_account_balance
+        self.total_returns = 0
+        self.current_step, self.end_step = self.episode_sampler.sample()
+        self.total_rewards = 0
+        self.timestamp_reward = 0
+        self._initialize_trading_history()
+
+        return self._next_observation(), self._get_info()
+
+    def _define_observation_space(self) -> gym.spaces.Box:
+        observation_space_shape = self.observation_buffer.shape
+        low_bound_observation_space = np.full(observation_space_shape, -np.inf)
+        low_bound_observation_space[:, :, -3:] = (0, 0, -np.inf) #position, action and account balance low observations
+        high_bound_observation_space = np.full(observation_space_shape, np.inf)
+        high_bound_observation_space[:, :, -3:] = (2, 2, np.inf) #position, action and account balance high observations
+        if self.flatten_assets:
+            observation_space_shape = (self.window_size + 1, -1)
+            low_bound_observation_space = low_bound_observation_space.reshape(observation_space_shape)
+            high_bound_observation_space = high_bound_observation_space.reshape(observation_space_shape)
+
+        return Box(low=low_bound_observation_space, high=high_bound_observation_space, shape=low_bound_observation_space.shape, dtype=np.float64)
+
+    def _initialize_observation_agent_states(self) -> None:
+        #buffer circular duplicado como en SingleAssetTradingEnvironment, con el estado de todos los activos en cada fila
+        self.agent_states_buffer = np.empty((2 * (self.window_size + 1), len(self.assets), 3))
+        self.agent_states_buffer[:] = np.stack((self.current_positions, self.current_actions, self.asset_balances / self.normalization_factor), axis=1)
+        self.agent_states_head = 0
+
+    @property
+    def observation_agent_states(self) -> np.array:
+        return self.agent_states_buffer[self.agent_states_head: self.agent_states_head + self.window_size + 1]
+
+    def _update_observation_agent_states(self) -> None:
+        current_agent_states = np.stack((self.current_positions, self.current_actions, self.asset_balances / self.normalization_factor), axis=1)
+        self.agent_states_buffer[self.agent_states_head] = current_agent_states
+        self.agent_states_buffer[self.agent_states_head + self.window_size + 1] = current_agent_states
+        self.agent_states_head = (self.agent_states_head + 1) % (self.window_size + 1)
+
+    def _take_action(self, actions: np.array) -> None:
+        actions = np.asarray(actions, dtype=np.int8)
+        current_prices = self.close_prices[self.current_step]
+
+        #el primer step del episodio no procesa las acciones, igual que SingleAssetTradingEnvironment
+        if self.trading_history_length > 1:
+            self.asset_balances = self.asset_balances * get_account_balance_factors(self.current_positions, actions, self.last_prices, current_prices, self.trade_commission)
+            self.current_positions = NEXT_POSITION[self.current_positions, actions]
+            self.current_actions = actions
+
+        self.account_balance = self.asset_balances.sum()
+        self.total_returns = (self.account_balance / self.initial_account_balance) - 1
+        self._save_trading_history(current_prices)
+
+        #balance de cada activo de hace REWARD_WINDOW - 1 steps, o el inicial si el episodio es más corto
+        rolling_asset_balances = self.asset_balance_history[self.trading_history_length % REWARD_WINDOW if self.trading_history_length >= REWARD_WINDOW else 0]
+        self.timestamp_reward = float(get_rewards(self.current_positions, self.current_actions, self.asset_balances, rolling_asset_balances).mean())
+
+    def _initialize_trading_history(self) -> None:
+        self.trading_history_length = 1
+        self.last_prices = self.close_prices[0]
+        self.asset_balance_history[0] = self.asset_balances
+
+    def _save_trading_history(self, current_prices: np.array) -> None:
+        self.asset_balance_history[self.trading_history_length % REWARD_WINDOW] = self.asset_balances
+        self.trading_history_length += 1
+        self.last_prices = current_prices
+
+    def step(self, action: np.array) -> Tuple[np.array, float, bool, bool, dict]:
+        self._take_action(action)
+        self.total_rewards += self.timestamp_reward
+        observation = self._next_observation()
+
+        self.current_step += 1
+        terminated = bool(self.account_balance <= 0 or self.current_step == self.end_step)
+
+        info = self._get_info()
+        if self.log_interval and self.current_step % self.log_interval == 0:
+            self._logger.info(info)
+
+        return observation, self.timestamp_reward, terminated, False, info
+
+    def _get_info(self) -> dict:
+        return {
+            "ACCOUNT BALANCE": self.account_balance,
+            "TOTAL RETURNS": self.total_returns,
+            "TOTAL REWARDS": self.total_rewards,
+            "AGENT POSITIONS": {asset: POSITION_NAMES[position] for asset, position in zip(self.assets, self.current_positions)},
+            "AGENT ACTIONS": {asset: ACTION_NAMES[action] for asset, action in zip(self.assets, self.current_actions)},
+            "STEP": self.current_step
+        }
+
+    def render(self, mode="console") -> None:
+        if mode == "console":
+            print("----------------------------------------------------")
+            for name, value in self._get_info().items():
+                print(f"{name}: {value}")
+            print("----------------------------------------------------")
+            print()
+            print()
+
+    def _next_observation(self) -> np.array:
+        market_states_columns = self.market_states.shape[2]
+        self.observation_buffer[:, :, :market_states_columns] = self.market_state_windows[self.current_step - self.window_size]
+        self._update_observation_agent_states()
+        self.observation_buffer[:, :, market_states_columns:] = self.observation_agent_states
+
+        observation = self.observation_buffer.reshape(self.window_size + 1, -1) if self.flatten_assets else self.observation_buffer
+        return observation.copy() if self.copy_observations else observation
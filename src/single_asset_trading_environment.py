@@ -1,26 +1,39 @@
 import random
+import logging
 import gymnasium as gym
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
 from typing import Tuple, Optional
+from numpy.lib.stride_tricks import sliding_window_view
 from gymnasium.spaces import Discrete, Box
 
+from market_data import load_market_arrays, NORMALIZATION_FACTOR
+from trading_history import TradingHistory
+from episode_sampler import EpisodeSampler, get_episode_seed
+from instrumentation import InstrumentedEnvironment
 
-class SingleAssetTradingEnvironment(gym.Env):
+logging.basicConfig(level=logging.INFO)
+
+
+class SingleAssetTradingEnvironment(InstrumentedEnvironment, gym.Env):
     metadata = {'render.modes': ['human']}
 
     def __init__(self, config: dict):
         super(SingleAssetTradingEnvironment, self).__init__()
 
-        self.df = pd.read_csv(config["data_path"])[["open","high","close","min"]]
         self.initial_account_balance = config["initial_account_balance"]
         self.window_size = config["window_size"]
         self.account_balance = config["initial_account_balance"]
         self.total_returns = 0
         self.trade_commission = 0.001
-        self.normalization_factor = 999999
+        self.normalization_factor = NORMALIZATION_FACTOR
+
+        #las features de mercado se normalizan una sola vez en un array float32 contiguo, y cada observación es una vista de una ventana.
+        #con "market_data_path" los arrays son memory maps de solo lectura compartidos por todos los workers
+        self.market_states, self.close_prices, timestamps = load_market_arrays(config)
+        self.market_state_windows = sliding_window_view(self.market_states, self.window_size + 1, axis=0).transpose(0, 2, 1)
 
         self.positions = {
             "LONG": 0,
@@ -34,23 +47,44 @@ class SingleAssetTradingEnvironment(gym.Env):
         }
         self.current_position = self.positions["FLAT"]
         self.current_action = self.actions["HOLD"]
-        self.trading_history = {}
+        self.episode_sampler = EpisodeSampler(
+            rows=self.close_prices.shape[0],
+            window_size=self.window_size,
+            timestamps=timestamps,
+            episode_length=config.get("episode_length"),
+            random_start=config.get("random_start", False),
+            seed=get_episode_seed(config)
+        )
+        self.current_step, self.end_step = self.window_size, self.close_prices.shape[0] - 1
+        self.trading_history = TradingHistory(capacity=self.episode_sampler.longest_episode_length + 1) #un registro por step del episodio más el inicial
         self.total_rewards = 0
         self.timestamp_reward = 0
 
+        self.copy_observations = config.get("copy_observations", True)
+
+        #el info solo se loguea cada log_interval steps (0 nunca) y si el nivel del logger lo permite
+        self._logger = logging.getLogger("environment_logger")
+        self._logger.setLevel(config.get("log_level", logging.INFO))
+        self.log_interval = config.get("log_interval", 0)
+
+        self._setup_instrumentation(config, [("take_action", "_take_action"), ("next_observation", "_next_observation")])
+        self.observation_buffer = np.empty((self.window_size + 1, self.market_states.shape[1] + 3))
+
         self._initialize_trading_history()
-        self.observation_agent_states = self._initialize_observation_agent_states()
+        self._initialize_observation_agent_states()
         self.action_space = Discrete(len(list(self.actions.keys())))
         self.observation_space = self._define_observation_space()
 
-    def reset(self, seed: Optional[int] = 42, options: Optional[dict] = None) -> Tuple[np.array, dict]:
+    def reset(self, seed: Optional[int] = None, options: Optional[dict] = None) -> Tuple[np.array, dict]:
         super().reset(seed=seed)
+        if seed is not None:
+            self.episode_sampler.seed(seed)
 
         self.current_position = self.positions["FLAT"]
         self.current_action = self.actions["HOLD"]
         self.account_balance = self.initial_account_balance
         self.total_returns = 0
-        self.current_step = self.window_size
+        self.current_step, self.end_step = self.episode_sampler.sample()
         self.total_rewards = 0
         self.timestamp_reward = 0
         self._initialize_trading_history()
@@ -68,42 +102,45 @@ class SingleAssetTradingEnvironment(gym.Env):
     
     def _define_observation_space(self) -> gym.spaces.Box:
         low_agent_state = np.array([[0, 0, -np.inf] for _ in range(self.window_size + 1)]) #position, action and account balance low observations
-        low_market_state = np.array([[-np.inf for _ in range(self.df.shape[1])] for _ in range(self.window_size + 1)]) #low for all asset features for window size + current position timesteps
+        low_market_state = np.array([[-np.inf for _ in range(self.market_states.shape[1])] for _ in range(self.window_size + 1)]) #low for all asset features for window size + current position timesteps
 
         high_agent_state = np.array([[2, 2, np.inf] for _ in range(self.window_size + 1)]) #position, action and account balance high observations
-        high_market_state = np.array([[np.inf for _ in range(self.df.shape[1])] for _ in range(self.window_size + 1)]) #high for all asset features for window size + current position timesteps
+        high_market_state = np.array([[np.inf for _ in range(self.market_states.shape[1])] for _ in range(self.window_size + 1)]) #high for all asset features for window size + current position timesteps
 
         low_bound_observation_space = np.concatenate((low_market_state, low_agent_state), axis=1) #concatenate low agent state and low market state arrays
         high_bound_observation_space = np.concatenate((high_market_state, high_agent_state), axis=1) #concatenate high agent state and low market state arrays
 
-        return Box(low=low_bound_observation_space, high=high_bound_observation_space, shape=(self.window_size + 1, low_bound_observation_space.shape[1]))
+        return Box(low=low_bound_observation_space, high=high_bound_observation_space, shape=(self.window_size + 1, low_bound_observation_space.shape[1]), dtype=np.float64)
+
+    def _initialize_observation_agent_states(self) -> None:
+        #buffer circular duplicado: cada estado se escribe en la fila head y en head + window_size + 1, así la ventana
+        #siempre es un slice contiguo del buffer y actualizarla no mueve ni reserva memoria
+        self.agent_states_buffer = np.empty((2 * (self.window_size + 1), 3))
+        self.agent_states_buffer[:] = (self.current_position, self.current_action, self.account_balance / self.normalization_factor)
+        self.agent_states_head = 0
 
-    def _initialize_observation_agent_states(self) -> np.array:
-        agent_states = [[self.current_position, self.current_action, self.account_balance / self.normalization_factor]] * (self.window_size + 1)
-        return np.array(agent_states)
+    @property
+    def observation_agent_states(self) -> np.array:
+        return self.agent_states_buffer[self.agent_states_head: self.agent_states_head + self.window_size + 1]
 
     def _update_observation_agent_states(self) -> None:
-        current_agent_state = np.array([[self.current_position, self.current_action, self.account_balance / self.normalization_factor]])
-        self.observation_agent_states = np.concatenate((self.observation_agent_states[1:,:], current_agent_state), axis=0)
+        current_agent_state = (self.current_position, self.current_action, self.account_balance / self.normalization_factor)
+        self.agent_states_buffer[self.agent_states_head] = current_agent_state
+        self.agent_states_buffer[self.agent_states_head + self.window_size + 1] = current_agent_state
+        self.agent_states_head = (self.agent_states_head + 1) % (self.window_size + 1)
 
     def _get_observation_market_states(self) -> np.array:
-        market_states = np.array([
-            self.df.loc[(self.current_step - self.window_size): (self.current_step), 'open'].values,
-            self.df.loc[(self.current_step - self.window_size): (self.current_step), 'high'].values,
-            self.df.loc[(self.current_step - self.window_size): (self.current_step), 'min'].values,
-            self.df.loc[(self.current_step - self.window_size): (self.current_step), 'close'].values
-        ])
-
-        return market_states.T / self.normalization_factor
+        return self.market_state_windows[self.current_step - self.window_size]
     
     def _take_action(self, action: int) -> None:
         #current_price = random.uniform(self.df.loc[self.current_step, "open"], self.df.loc[self.current_step, "close"]) #ESTO ES UNA EXAGERACIÓN PARA SIMULAR QUE EN LA PRACTICA NO ENTRAS JUSTO EN EL PRECIO DE OPEN NUNCA
-        current_price = self.df.loc[self.current_step, "close"]
+        current_price = self.close_prices[self.current_step]
 
-        if len(self.trading_history["ACCOUNT_BALANCE"]) > 1:
+        if len(self.trading_history) > 1:
+            previous_price = self.trading_history.last_price
 
             if self.current_position == 0: #LONG
-                price_pct_change = (current_price - self.trading_history["PRICE"][-1]) / self.trading_history["PRICE"][-1]
+                price_pct_change = (current_price - previous_price) / previous_price
 
                 if action == 0: #BUY
                     self.current_action = self.actions["BUY"]
@@ -116,7 +153,7 @@ class SingleAssetTradingEnvironment(gym.Env):
                     self.current_action = self.actions["HOLD"]
 
             elif self.current_position == 1: #SHORT
-                price_pct_change = (self.trading_history["PRICE"][-1] - current_price) / self.trading_history["PRICE"][-1]
+                price_pct_change = (previous_price - current_price) / previous_price
 
                 if action == 0: #BUY
                     self.account_balance *= (1 - price_pct_change) * (1 - self.trade_commission)
@@ -129,7 +166,6 @@ class SingleAssetTradingEnvironment(gym.Env):
                     self.current_action = self.actions["HOLD"]
 
             elif self.current_position == 2: #FLAT
-                price_pct_change = (current_price - self.trading_history["PRICE"][-1]) / self.trading_history["PRICE"][-1]
 
                 if action == 0: #BUY
                     self.account_balance *= (1 - self.trade_commission)
@@ -145,30 +181,22 @@ class SingleAssetTradingEnvironment(gym.Env):
         self.total_returns = (self.account_balance / self.initial_account_balance) - 1
         self._save_trading_history(current_price)
 
-        if len(self.trading_history["ACCOUNT_BALANCE"]) > 1:
+        if len(self.trading_history) > 1:
             window = 24 #X horas + la hora actual
             if self.current_position == 0 and self.current_action == 0:
                 self.timestamp_reward = -1
             elif self.current_position == 1 and self.current_action == 1:
                 self.timestamp_reward = -1
             else:
-                self.timestamp_reward = self.account_balance / self.trading_history["ACCOUNT_BALANCE"][-min(len(self.trading_history["ACCOUNT_BALANCE"]), window)] - 1.0
+                self.timestamp_reward = self.account_balance / self.trading_history.rolling_account_balance(window) - 1.0
         else:
             self.timestamp_reward = 0.0
         
     def _initialize_trading_history(self) -> None:
-        self.trading_history = {
-            "ACCOUNT_BALANCE": [self.account_balance],
-            "POSITION": [self.current_position],
-            "ACTION": [self.current_action],
-            "PRICE": [self.df["close"].iloc[0]]
-        }
+        self.trading_history.reset(self.account_balance, self.current_position, self.current_action, self.close_prices[0])
 
     def _save_trading_history(self, current_price) -> None:
-        self.trading_history["ACCOUNT_BALANCE"].append(self.account_balance)
-        self.trading_history["POSITION"].append(self.current_position)
-        self.trading_history["ACTION"].append(self.current_action)
-        self.trading_history["PRICE"].append(current_price)
+        self.trading_history.append(self.account_balance, self.current_position, self.current_action, current_price)
         
     def step(self, action: int) -> Tuple[pd.DataFrame, float, bool, bool, dict]:
         self._take_action(action)
@@ -177,7 +205,7 @@ class SingleAssetTradingEnvironment(gym.Env):
 
         self.current_step += 1
 
-        if self.account_balance <= 0 or self.current_step == self.df.shape[0] - 1:
+        if self.account_balance <= 0 or self.current_step == self.end_step:
             terminated = True
         else:
             terminated = False
@@ -190,11 +218,14 @@ class SingleAssetTradingEnvironment(gym.Env):
             "AGENT ACTION": self._get_action_name(),
             "STEP": self.current_step
         }
-        #if self.current_step % 5000 == 0:
-        print(info)
+        if self.log_interval and self.current_step % self.log_interval == 0:
+            self._logger.info(info)
 
         return observation, self.timestamp_reward, terminated, False, info
     
+    def export_trading_history(self, path: str) -> None:
+        self.trading_history.to_parquet(path)
+
     def _get_action_name(self) -> str:
         if self.current_action == 0:
             return "BUY"
@@ -225,8 +256,8 @@ class SingleAssetTradingEnvironment(gym.Env):
             print()
         elif mode == "human":
             percentage_total_returns = np.round(self.total_returns, 4) * 100
-            buy_actions = [i for i in range(len(self.trading_history["ACTION"])) if self.trading_history["ACTION"][i] == 0]
-            sell_actions = [i for i in range(len(self.trading_history["ACTION"])) if self.trading_history["ACTION"][i] == 1]
+            buy_actions = np.flatnonzero(self.trading_history["ACTION"] == 0)
+            sell_actions = np.flatnonzero(self.trading_history["ACTION"] == 1)
 
             fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20,10))
 
@@ -237,16 +268,19 @@ class SingleAssetTradingEnvironment(gym.Env):
             
             ax2.set_title(f"AGENT TRADING HISTORY | RETURNS {percentage_total_returns}%", fontsize=14)
             ax2.plot(self.trading_history["PRICE"])
-            ax2.scatter(x=buy_actions, y=np.array(self.trading_history["PRICE"])[buy_actions], marker="^", color="green")
-            ax2.scatter(x=sell_actions, y=np.array(self.trading_history["PRICE"])[sell_actions], marker="v", color="red")
+            ax2.scatter(x=buy_actions, y=self.trading_history["PRICE"][buy_actions], marker="^", color="green")
+            ax2.scatter(x=sell_actions, y=self.trading_history["PRICE"][sell_actions], marker="v", color="red")
             ax2.legend(["ASSET PRICE", "BUY", "SELL"], fontsize=12)
             ax2.grid()
             plt.show()
             
 
     def _next_observation(self) -> np.array:
-        market_states_observation = self._get_observation_market_states()
+        #la observación se monta sobre el mismo buffer en cada step, copy_observations=False evita la copia si quien
+        #llama no guarda las observaciones de steps anteriores
+        market_states_columns = self.market_states.shape[1]
+        self.observation_buffer[:, :market_states_columns] = self._get_observation_market_states()
         self._update_observation_agent_states()
-        observation = np.append(market_states_observation, self.observation_agent_states, axis=1)
+        self.observation_buffer[:, market_states_columns:] = self.observation_agent_states
 
-        return observation
\ No newline at end of file
+        return self.observation_buffer.copy() if self.copy_observations else self.observation_buffer
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import sys
+import logging
+import argparse
+import pandas as pd
+
+import agent
+
+SUMMARY_COLUMNS = {
+    "trial_id": "TRIAL",
+    "training_iteration": "ITERATIONS",
+    "time_total_s": "SECONDS",
+    "timesteps_total": "TIMESTEPS",
+    "episode_reward_mean": "EPISODE REWARD MEAN",
+    "config/train_batch_size": "TRAIN BATCH SIZE",
+    "config/sgd_minibatch_size": "SGD MINIBATCH SIZE",
+    "config/model/lstm_cell_size": "LSTM CELL SIZE",
+    "config/env_config/window_size": "WINDOW SIZE"
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_param_space(args: argparse.Namespace, algo: str, env_config: dict) -> dict:
+    """
+        RLlib config of agent.get_rllib_config as a dict, with the swept settings replaced by Tune search spaces. Every
+        trial reads the same memory mapped market data of env_config, only its window changes.
+    """
+    from ray import tune
+
+    agent_args = agent.get_parser().parse_args([])
+    vars(agent_args).update(algo=algo, num_rollout_workers=args.num_rollout_workers, num_gpus=0)
+    param_space = agent.get_rllib_config(agent_args, env_config).to_dict()
+
+    param_space["env_config"] = dict(env_config, window_size=tune.choice(args.window_sizes))
+    param_space["model"] = dict(param_space["model"], lstm_cell_size=tune.choice(args.lstm_cell_sizes))
+    #la secuencia del LSTM tiene que cubrir la ventana elegida para el trial
+    param_space["model"]["max_seq_len"] = tune.sample_from(lambda spec: spec["config"]["env_config"]["window_size"] + 1)
+    param_space["train_batch_size"] = tune.choice(args.train_batch_sizes)
+    if algo == "PPO":
+        param_space["sgd_minibatch_size"] = tune.choice(args.sgd_minibatch_sizes)
+    return param_space
+
+
+def run_sweep(args: argparse.Namespace) -> pd.DataFrame:
+    """
+        Runs num_samples trials of every algorithm with Tune, as many at once as the CPUs allow, stopping the ones that
+        fall behind with ASHA. Returns the summary table of all the trials sorted by their last episode reward mean.
+    """
+    import ray
+    from ray import air, tune
+    from ray.tune.schedulers import ASHAScheduler
+
+    num_cpus = os.cpu_count() if args.num_cpus is None else args.num_cpus
+    ray.init(num_cpus=num_cpus)
+    #cada trial ocupa un CPU para su worker local (que también muestrea) más uno por rollout worker
+    max_concurrent_trials = max(num_cpus // (1 + args.num_rollout_workers), 1)
+
+    #el CSV se parsea una sola vez, todos los trials mapean los mismos arrays en modo solo lectura
+    env_config = agent.get_env_config(argparse.Namespace(
+        env="vectorized", assets=None, data_path=args.data_path, market_data_path=args.market_data_path, initial_account_balance=args.initial_account_balance,
+        window_size=max(args.window_sizes), num_envs=args.num_envs, log_interval=0
+    ))
+    #episodios cortos desde un punto aleatorio, para que cada iteración termine episodios y reporte su recompensa media
+    env_config.update(episode_length=args.episode_length, random_start=True)
+
+    summaries = []
+    for algo in args.algos:
+        logger.info(f"Sweeping {algo} with {args.num_samples} trials, {max_concurrent_trials} at once")
+        tuner = tune.Tuner(
+            agent.get_algorithm_class(algo),
+            param_space=get_param_space(args, algo, env_config),
+            tune_config=tune.TuneConfig(
+                metric="episode_reward_mean",
+                mode="max",
+                scheduler=ASHAScheduler(
+                    time_attr="training_iteration",
+                    max_t=args.max_iterations,
+                    grace_period=args.grace_period,
+                    reduction_factor=args.reduction_factor
+                ),
+                num_samples=args.num_samples,
+                max_concurrent_trials=max_concurrent_trials
+            ),
+            run_config=air.RunConfig(
+                name=f"sweep_{algo}",
+                local_dir=os.path.abspath(args.results_path),
+                stop={"training_iteration": args.max_iterations}
+            )
+        )
+        results = tuner.fit().get_dataframe()
+        summary = results[[column for column in SUMMARY_COLUMNS if column in results.columns]].rename(columns=SUMMARY_COLUMNS)
+        summary.insert(0, "ALGORITHM", algo)
+        summaries.append(summary)
+
+    return pd.concat(summaries, ignore_index=True).sort_values("EPISODE REWARD MEAN", ascending=False, ignore_index=True)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Hyperparameter and algorithm sweep of the trading agent with Ray Tune")
+    parser.add_argument("--algos", nargs="+", choices=list(agent.ALGORITHMS), default=["PPO"])
+    parser.add_argument("--data-path", default="../data/merged/cleaned_1_H_merged_data.csv")
+    parser.add_argument("--market-data-path", default="../data/merged/market_data", help="Folder of the memory mapped arrays")
+    parser.add_argument("--results-path", default="../sweeps", help="Folder of the Tune results of the trials")
+    parser.add_argument("--summary-path", default="../sweeps/summary.csv")
+    parser.add_argument("--initial-account-balance", type=float, default=10000)
+    parser.add_argument("--num-envs", type=int, default=16)
+    parser.add_argument("--episode-length", type=int, default=100, help="Steps of every episode, each one starts at a random bar. Shorter than the train batch of each env so every iteration ends episodes")
+    parser.add_argument("--window-sizes", nargs="+", type=int, default=[25, 50, 100])
+    parser.add_argument("--lstm-cell-sizes", nargs="+", type=int, default=[64, 128, 256])
+    parser.add_argument("--train-batch-sizes", nargs="+", type=int, default=[2048, 4096, 8192])
+    parser.add_argument("--sgd-minibatch-sizes", nargs="+", type=int, default=[128, 256, 512], help="Only used by PPO")
+    parser.add_argument("--num-samples", type=int, default=16, help="Trials per algorithm")
+    parser.add_argument("--max-iterations", type=int, default=100)
+    parser.add_argument("--grace-period", type=int, default=10, help="Iterations every trial runs before ASHA can stop it")
+    parser.add_argument("--reduction-factor", type=int, default=3)
+    parser.add_argument("--num-rollout-workers", type=int, default=0, help="Per trial, 0 samples in the trial's own worker")
+    parser.add_argument("--num-cpus", type=int, default=None, help="CPUs of the local Ray cluster, all of them if not set")
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    args = get_parser().parse_args(argv)
+    summary = run_sweep(args)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.summary_path)), exist_ok=True)
+    summary.to_csv(args.summary_path, index=False)
+    print(summary.to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,23 +3,19 @@ import os
 import pandas as pd
 
 from single_asset_trading_environment import SingleAssetTradingEnvironment
-
-def create_datetime(row):
-    date = row["date"]
-    time = row["hour"]
-    date = f"{date.split('.')[0]}-{date.split('.')[1]}-{date.split('.')[2]} {time.split(':')[0]}:{time.split(':')[1]}:00"
-    row["date"] = date
-
-    return row
+from timestamps import parse_axiory_timestamps
+from resample import resample_bars
 
 def clean_df(df: pd.DataFrame) -> pd.DataFrame:
     print("CLEANING DATAFRAME...")
 
-    df = df.apply(create_datetime, axis=1)
-    df["date"] = pd.to_datetime(df["date"])
+    if "hour" in df.columns: #los datos extraídos ya vienen con la fecha parseada, solo los CSV antiguos traen date + hour
+        df["date"] = pd.to_datetime(parse_axiory_timestamps(df["date"], df["hour"]), utc=True)
+    else:
+        df["date"] = pd.to_datetime(df["date"], utc=True)
     df = df.sort_values(by=["date"])
-    df = df[(df["date"].dt.hour % 1 == 0) & (df["date"].dt.minute == 0)]    
-    df = df[["open", "high", "close", "min"]].reset_index()
+    df = resample_bars(df.rename(columns={"min": "low"}), "1H").rename(columns={"low": "min"}) #velas OHLC reales de 1 hora, no solo el minuto 0
+    df = df[["date", "open", "high", "close", "min"]].reset_index(drop=True) #la fecha se mantiene para que el env detecte los huecos del mercado
 
     print("DATAFRAME HAS BEEN CLEANED.")
 
@@ -40,7 +36,10 @@ if __name__ == "__main__":
     env_config = {
         "data_path": data_path,
         "initial_account_balance": initial_account_balance,
-        "window_size": window_size
+        "window_size": window_size,
+        "log_interval": 1000,
+        "instrumentation": True,
+        "metrics_callback": print
     }
 
     env = SingleAssetTradingEnvironment(env_config)
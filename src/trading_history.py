@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+class TradingHistory:
+    """
+        Trading history of an episode backed by NumPy arrays that are reserved once with the maximum episode length, so
+        the memory of every environment is fixed and saving a step doesn't allocate.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.account_balance = np.empty(capacity, dtype=np.float64)
+        self.position = np.empty(capacity, dtype=np.int8)
+        self.action = np.empty(capacity, dtype=np.int8)
+        self.price = np.empty(capacity, dtype=np.float64)
+        self.length = 0
+
+    def reset(self, account_balance: float, position: int, action: int, price: float) -> None:
+        self.length = 0
+        self.append(account_balance, position, action, price)
+
+    def append(self, account_balance: float, position: int, action: int, price: float) -> None:
+        if self.length == self.capacity:
+            self._grow()
+        self.account_balance[self.length] = account_balance
+        self.position[self.length] = position
+        self.action[self.length] = action
+        self.price[self.length] = price
+        self.length += 1
+
+    def _grow(self) -> None:
+        # Only happens if the episode is longer than the capacity the history was created with
+        self.capacity *= 2
+        for name in ("account_balance", "position", "action", "price"):
+            column = getattr(self, name)
+            grown_column = np.empty(self.capacity, dtype=column.dtype)
+            grown_column[:self.length] = column[:self.length]
+            setattr(self, name, grown_column)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, column: str) -> np.array:
+        # Same keys as the dict of lists the history used to be
+        return {
+            "ACCOUNT_BALANCE": self.account_balance,
+            "POSITION": self.position,
+            "ACTION": self.action,
+            "PRICE": self.price
+        }[column][:self.length]
+
+    @property
+    def last_price(self) -> float:
+        return self.price[self.length - 1]
+
+    def rolling_account_balance(self, window: int) -> float:
+        """ Account balance window - 1 steps ago (or the first one if the episode is shorter), in constant time """
+        return self.account_balance[max(self.length - window, 0)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "ACCOUNT_BALANCE": self["ACCOUNT_BALANCE"],
+            "POSITION": self["POSITION"],
+            "ACTION": self["ACTION"],
+            "PRICE": self["PRICE"]
+        })
+
+    def to_parquet(self, path: str) -> None:
+        self.to_dataframe().to_parquet(path, index=False)
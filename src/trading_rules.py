@@ -0,0 +1,52 @@
+import numpy as np
+
+POSITION_NAMES = ("LONG", "SHORT", "FLAT")
+ACTION_NAMES = ("BUY", "SELL", "HOLD")
+REWARD_WINDOW = 24 #X horas + la hora actual
+
+#posición después de la acción, indexado por [posición, acción]
+NEXT_POSITION = np.array([
+    [0, 2, 0], #LONG: BUY mantiene, SELL cierra, HOLD mantiene
+    [2, 1, 1], #SHORT: BUY cierra, SELL mantiene, HOLD mantiene
+    [0, 1, 2]  #FLAT: BUY abre LONG, SELL abre SHORT, HOLD mantiene
+], dtype=np.int8)
+
+
+def get_account_balance_factors(positions: np.array, actions: np.array, previous_prices: np.array,
+                                current_prices: np.array, trade_commission: float) -> np.array:
+    """
+        Factor the account balance of every element (sub environment or asset) is multiplied by when it takes its
+        action, the same rules of SingleAssetTradingEnvironment._take_action computed with the same operations and in the
+        same order, so the balances are identical.
+    """
+    long_pct_changes = (current_prices - previous_prices) / previous_prices
+    short_pct_changes = (previous_prices - current_prices) / previous_prices
+    is_long, is_short, is_flat = positions == 0, positions == 1, positions == 2
+    is_buy, is_sell, is_hold = actions == 0, actions == 1, actions == 2
+
+    return np.select(
+        [
+            is_long & is_sell,
+            is_long & is_hold,
+            is_short & is_buy,
+            is_short & is_hold,
+            is_flat & (is_buy | is_sell)
+        ],
+        [
+            (1 + long_pct_changes) * (1 - trade_commission),
+            1 + long_pct_changes,
+            (1 - short_pct_changes) * (1 - trade_commission),
+            1 + short_pct_changes,
+            np.full_like(long_pct_changes, 1 - trade_commission)
+        ],
+        default=1.0
+    )
+
+
+def get_rewards(positions: np.array, actions: np.array, account_balances: np.array, rolling_account_balances: np.array) -> np.array:
+    """ -1 for buying while long or selling while short, otherwise the return over the rolling reward window """
+    return np.where(
+        ((positions == 0) & (actions == 0)) | ((positions == 1) & (actions == 1)),
+        -1.0,
+        account_balances / rolling_account_balances - 1.0
+    )
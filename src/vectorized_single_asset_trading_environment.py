@@ -0,0 +1,194 @@
+import logging
+import numpy as np
+
+from typing import List, Optional, Tuple
+from numpy.lib.stride_tricks import sliding_window_view
+from gymnasium.spaces import Discrete, Box
+from ray.rllib.env.vector_env import VectorEnv
+
+from market_data import load_market_arrays, NORMALIZATION_FACTOR
+from episode_sampler import EpisodeSampler, get_episode_seed
+from instrumentation import InstrumentedEnvironment
+from trading_rules import ACTION_NAMES, NEXT_POSITION, POSITION_NAMES, REWARD_WINDOW, get_account_balance_factors, get_rewards
+
+
+class VectorizedSingleAssetTradingEnvironment(InstrumentedEnvironment, VectorEnv):
+    """
+        N independent episodes of SingleAssetTradingEnvironment advanced in lockstep. Positions, account balances,
+        rewards and observations of every sub environment are NumPy arrays, so a step is a few array operations over the
+        N episodes instead of N Python steps. Each sub environment gets the same observations and rewards as a
+        SingleAssetTradingEnvironment that receives the same actions.
+    """
+
+    def __init__(self, config: dict):
+        num_envs = config.get("num_envs", 1)
+        self.window_size = config["window_size"]
+        self.trade_commission = 0.001
+        self.normalization_factor = NORMALIZATION_FACTOR
+
+        #mismo logging e instrumentación que SingleAssetTradingEnvironment, medidos por step vectorizado
+        self._logger = logging.getLogger("environment_logger")
+        self._logger.setLevel(config.get("log_level", logging.INFO))
+        self.log_interval = config.get("log_interval", 0)
+        self.vector_steps = 0
+
+        self._setup_instrumentation(config, [("take_action", "_take_actions"), ("next_observation", "_next_observations")], "vector_step")
+
+        self.market_states, self.close_prices, timestamps = load_market_arrays(config)
+        self.market_state_windows = sliding_window_view(self.market_states, self.window_size + 1, axis=0).transpose(0, 2, 1)
+
+        observation_space_shape = (self.window_size + 1, self.market_states.shape[1] + 3)
+        low_bound_observation_space = np.full(observation_space_shape, -np.inf)
+        low_bound_observation_space[:, -3:] = (0, 0, -np.inf) #position, action and account balance low observations
+        high_bound_observation_space = np.full(observation_space_shape, np.inf)
+        high_bound_observation_space[:, -3:] = (2, 2, np.inf) #position, action and account balance high observations
+        super().__init__(
+            observation_space=Box(low=low_bound_observation_space, high=high_bound_observation_space, shape=observation_space_shape, dtype=np.float64),
+            action_space=Discrete(len(ACTION_NAMES)),
+            num_envs=num_envs
+        )
+
+        #un balance inicial para todos o uno por sub environment
+        self.initial_account_balances = np.broadcast_to(np.asarray(config["initial_account_balance"], dtype=np.float64), (num_envs,)).copy()
+        self.account_balances = self.initial_account_balances.copy()
+        self.current_positions = np.full(num_envs, 2, dtype=np.int8) #FLAT
+        self.current_actions = np.full(num_envs, 2, dtype=np.int8) #HOLD
+        self.current_steps = np.full(num_envs, self.window_size, dtype=np.int64)
+        self.total_returns = np.zeros(num_envs)
+        self.total_rewards = np.zeros(num_envs)
+        self.timestamp_rewards = np.zeros(num_envs)
+
+        #del historial de trading solo hacen falta el último precio y los últimos REWARD_WINDOW balances para el reward
+        self.trading_history_lengths = np.zeros(num_envs, dtype=np.int64)
+        self.last_prices = np.zeros(num_envs)
+        self.account_balance_history = np.zeros((num_envs, REWARD_WINDOW))
+
+        #un sampler por sub environment, cada uno con su propia semilla
+        self.episode_samplers = [
+            EpisodeSampler(
+                rows=self.close_prices.shape[0],
+                window_size=self.window_size,
+                timestamps=timestamps,
+                episode_length=config.get("episode_length"),
+                random_start=config.get("random_start", False),
+                seed=get_episode_seed(config, index)
+            ) for index in range(num_envs)
+        ]
+        self.end_steps = np.full(num_envs, self.close_prices.shape[0] - 1, dtype=np.int64)
+        self.env_indexes = np.arange(num_envs)
+        self.window_indexes = np.arange(self.window_size + 1)
+
+        self._initialize_observation_agent_states()
+        for index in range(num_envs):
+            self._initialize_trading_history(index)
+
+    def vector_reset(self, *, seeds: Optional[List[int]] = None, options: Optional[List[dict]] = None) -> Tuple[List[np.array], List[dict]]:
+        seeds = [None] * self.num_envs if seeds is None else seeds
+        options = [None] * self.num_envs if options is None else options
+        for index in range(self.num_envs):
+            self._reset_state(index, seeds[index], options[index])
+        return list(self._next_observations(self.env_indexes)), [self._get_info(index) for index in range(self.num_envs)]
+
+    def reset_at(self, index: Optional[int] = None, *, seed: Optional[int] = None, options: Optional[dict] = None) -> Tuple[np.array, dict]:
+        index = 0 if index is None else index
+        self._reset_state(index, seed, options)
+        return self._next_observations(self.env_indexes[index:index + 1])[0], self._get_info(index)
+
+    def _reset_state(self, index: int, seed: Optional[int], options: Optional[dict]) -> None:
+        if seed is not None:
+            self.episode_samplers[index].seed(seed)
+        self.current_steps[index], self.end_steps[index] = self.episode_samplers[index].sample()
+
+        self.current_positions[index] = 2 #FLAT
+        self.current_actions[index] = 2 #HOLD
+        self.account_balances[index] = self.initial_account_balances[index]
+        self.total_returns[index] = 0
+        self.total_rewards[index] = 0
+        self.timestamp_rewards[index] = 0
+        self._initialize_trading_history(index)
+
+    def _initialize_trading_history(self, index: int) -> None:
+        self.trading_history_lengths[index] = 1
+        self.last_prices[index] = self.close_prices[0]
+        self.account_balance_history[index, 0] = self.account_balances[index]
+
+    def _initialize_observation_agent_states(self) -> None:
+        #mismo buffer circular duplicado que SingleAssetTradingEnvironment, uno por sub environment
+        self.agent_states_buffer = np.empty((self.num_envs, 2 * (self.window_size + 1), 3))
+        self.agent_states_buffer[:] = np.stack((self.current_positions, self.current_actions, self.account_balances / self.normalization_factor), axis=1)[:, np.newaxis, :]
+        self.agent_states_heads = np.zeros(self.num_envs, dtype=np.int64)
+
+    def vector_step(self, actions: List[int]) -> Tuple[List[np.array], List[float], List[bool], List[bool], List[dict]]:
+        self._take_actions(np.asarray(actions, dtype=np.int8))
+        self.total_rewards += self.timestamp_rewards
+        observations = self._next_observations(self.env_indexes)
+
+        self.current_steps += 1
+        self.vector_steps += 1
+        terminateds = (self.account_balances <= 0) | (self.current_steps == self.end_steps)
+        infos = [self._get_info(index) for index in range(self.num_envs)]
+
+        if self.log_interval and self.vector_steps % self.log_interval == 0:
+            self._logger.info({
+                "VECTOR STEP": self.vector_steps,
+                "MEAN ACCOUNT BALANCE": self.account_balances.mean(),
+                "MEAN TOTAL REWARDS": self.total_rewards.mean(),
+                "POSITIONS": np.bincount(self.current_positions, minlength=len(POSITION_NAMES)).tolist()
+            })
+
+        return list(observations), self.timestamp_rewards.tolist(), terminateds.tolist(), [False] * self.num_envs, infos
+
+    def _take_actions(self, actions: np.array) -> None:
+        current_prices = self.close_prices[self.current_steps]
+
+        #el primer step de cada episodio no procesa la acción, igual que SingleAssetTradingEnvironment
+        processed = self.trading_history_lengths > 1
+        account_balance_factors = get_account_balance_factors(self.current_positions, actions, self.last_prices, current_prices, self.trade_commission)
+        self.account_balances = np.where(processed, self.account_balances * account_balance_factors, self.account_balances)
+        self.current_positions = np.where(processed, NEXT_POSITION[self.current_positions, actions], self.current_positions)
+        self.current_actions = np.where(processed, actions, self.current_actions)
+
+        self.total_returns = (self.account_balances / self.initial_account_balances) - 1
+        self._save_trading_history(current_prices)
+
+        #balance de hace REWARD_WINDOW - 1 steps, o el inicial si el episodio es más corto
+        rolling_account_balances = np.where(
+            self.trading_history_lengths >= REWARD_WINDOW,
+            self.account_balance_history[self.env_indexes, self.trading_history_lengths % REWARD_WINDOW],
+            self.account_balance_history[:, 0]
+        )
+        self.timestamp_rewards = get_rewards(self.current_positions, self.current_actions, self.account_balances, rolling_account_balances)
+
+    def _save_trading_history(self, current_prices: np.array) -> None:
+        self.account_balance_history[self.env_indexes, self.trading_history_lengths % REWARD_WINDOW] = self.account_balances
+        self.trading_history_lengths += 1
+        self.last_prices = current_prices
+
+    def _next_observations(self, indexes: np.array) -> np.array:
+        current_agent_states = np.stack((self.current_positions[indexes], self.current_actions[indexes], self.account_balances[indexes] / self.normalization_factor), axis=1)
+        heads = self.agent_states_heads[indexes]
+        self.agent_states_buffer[indexes, heads] = current_agent_states
+        self.agent_states_buffer[indexes, heads + self.window_size + 1] = current_agent_states
+        heads = (heads + 1) % (self.window_size + 1)
+        self.agent_states_heads[indexes] = heads
+
+        #cada llamada devuelve un array nuevo: los collectors de RLlib guardan las observaciones sin copiarlas
+        market_states_columns = self.market_states.shape[1]
+        observations = np.empty((indexes.shape[0], self.window_size + 1, market_states_columns + 3))
+        observations[:, :, :market_states_columns] = self.market_state_windows[self.current_steps[indexes] - self.window_size]
+        observations[:, :, market_states_columns:] = self.agent_states_buffer[indexes[:, np.newaxis], heads[:, np.newaxis] + self.window_indexes]
+
+        return observations
+
+    def _get_info(self, index: int) -> dict:
+        return {
+            "ACCOUNT BALANCE": self.account_balances[index],
+            "TOTAL RETURNS": self.total_returns[index],
+            "TOTAL REWARDS": self.total_rewards[index],
+            "AGENT POSITION": POSITION_NAMES[self.current_positions[index]],
+            "AGENT ACTION": ACTION_NAMES[self.current_actions[index]],
+            "STEP": self.current_steps[index]
+        }
+
+    def get_sub_environments(self) -> list:
+        return []
@@ -0,0 +1,9 @@
+import os
+import sys
+
+PROJECT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+#los módulos de extract y src se importan sin paquete, igual que cuando se ejecutan desde sus carpetas
+for path in (PROJECT_PATH, os.path.join(PROJECT_PATH, "extract"), os.path.join(PROJECT_PATH, "src")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
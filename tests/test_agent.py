@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import agent
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    close = 1.1 + np.cumsum(np.random.default_rng(0).normal(0, 1e-3, 200))
+    bars = pd.DataFrame({"date": pd.date_range("2021-01-04", periods=close.shape[0], freq="min", tz="UTC"),
+                         "open": close, "high": close + 0.002, "close": close, "min": close - 0.002})
+    path = tmp_path / "data.csv"
+    pd.concat([bars.assign(asset="A"), bars.assign(asset="B")]).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("env, assets", [("single", []), ("vectorized", []), ("multi-asset", ["--assets", "A", "B"])])
+def test_env_config_builds_the_chosen_environment(data_path, tmp_path, env, assets):
+    args = agent.get_parser().parse_args(["--env", env, *assets, "--data-path", data_path, "--market-data-path", str(tmp_path / "market_data"),
+                                          "--window-size", "10", "--num-envs", "2"])
+    if env == "vectorized":
+        pytest.importorskip("ray")
+    env_config = agent.get_env_config(args)
+
+    environment = agent.get_environment_class(env)(env_config)
+    observation, _ = environment.vector_reset() if env == "vectorized" else environment.reset()
+    #RLlib solo tiene modelo por defecto para observaciones de como mucho 2 dimensiones que no sean imágenes
+    assert len(environment.observation_space.shape) == 2
+    assert environment.observation_space.contains(observation[0] if env == "vectorized" else observation)
+
+
+def test_multi_asset_environment_requires_assets(data_path, tmp_path):
+    args = agent.get_parser().parse_args(["--env", "multi-asset", "--data-path", data_path, "--market-data-path", str(tmp_path)])
+    with pytest.raises(ValueError):
+        agent.get_env_config(args)
+
+
+def test_flattened_multi_asset_observation_keeps_every_asset(data_path):
+    from multi_asset_trading_environment import MultiAssetTradingEnvironment
+
+    config = {"data_path": data_path, "assets": ["A", "B"], "initial_account_balance": 10000, "window_size": 10}
+    environment, flat_environment = MultiAssetTradingEnvironment(config), MultiAssetTradingEnvironment(dict(config, flatten_assets=True))
+    observation, _ = environment.reset()
+    flat_observation, _ = flat_environment.reset()
+    for action in ([0, 1], [2, 0], [1, 1]):
+        np.testing.assert_array_equal(flat_observation, observation.reshape(11, -1))
+        assert flat_environment.observation_space.contains(flat_observation)
+        observation = environment.step(action)[0]
+        flat_observation = flat_environment.step(action)[0]
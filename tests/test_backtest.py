@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from single_asset_trading_environment import SingleAssetTradingEnvironment
+from backtest import backtest
+
+INITIAL_ACCOUNT_BALANCE = 10000
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    close = 1.1 + np.cumsum(np.random.default_rng(0).normal(0, 1e-3, 500))
+    path = tmp_path / "data.csv"
+    pd.DataFrame({
+        "date": pd.date_range("2021-01-04", periods=close.shape[0], freq="h", tz="UTC"),
+        "open": close, "high": close + 0.002, "close": close, "min": close - 0.002
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_backtest_matches_the_environment(data_path, seed):
+    env = SingleAssetTradingEnvironment({"data_path": data_path, "initial_account_balance": INITIAL_ACCOUNT_BALANCE, "window_size": 50})
+    env.reset()
+    start_step = env.current_step
+
+    random_generator = np.random.default_rng(seed)
+    actions, total_reward, terminated = [], 0, False
+    while not terminated:
+        action = int(random_generator.integers(3))
+        actions.append(action)
+        observation, reward, terminated, truncated, info = env.step(action)
+        total_reward += reward
+
+    #el backtest vectorizado tiene que dar exactamente el mismo historial que el env con las mismas acciones
+    backtest_results = backtest(env.close_prices[start_step:], actions, INITIAL_ACCOUNT_BALANCE)
+    assert len(backtest_results) == len(actions)
+    for column in ("ACCOUNT_BALANCE", "POSITION", "ACTION"):
+        np.testing.assert_array_equal(backtest_results[column].to_numpy(), env.trading_history[column][1:])
+    assert backtest_results["TOTAL_REWARDS"].iloc[-1] == total_reward
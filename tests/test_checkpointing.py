@@ -0,0 +1,101 @@
+import os
+import pickle
+import numpy as np
+import pytest
+
+from checkpointing import Checkpointer
+
+
+class StubAlgorithm:
+    """ Algorithm whose state is a weights array trained in place, like the torch parameters of an RLlib policy """
+
+    def __init__(self, weights: float = 0.0):
+        self.iteration = 0
+        self.weights = np.full(1000, weights)
+
+    def __getstate__(self) -> dict:
+        return {"weights": self.weights}
+
+    def save_checkpoint(self, checkpoint_dir: str) -> str:
+        with open(os.path.join(checkpoint_dir, "algorithm_state.pkl"), "wb") as state_file:
+            pickle.dump(self.__getstate__(), state_file)
+        return checkpoint_dir
+
+    def load_checkpoint(self, checkpoint_dir: str) -> None:
+        with open(os.path.join(checkpoint_dir, "algorithm_state.pkl"), "rb") as state_file:
+            self.weights = pickle.load(state_file)["weights"]
+
+
+def train(algorithm: StubAlgorithm) -> None:
+    algorithm.iteration += 1
+    algorithm.weights += 1
+
+
+def test_save_prune_and_resume(tmp_path):
+    algorithm = StubAlgorithm()
+    checkpointer = Checkpointer(str(tmp_path), keep_last=2)
+    for episode, reward in enumerate([1, 5, 2, 3], start=1):
+        train(algorithm)
+        checkpointer.save(algorithm, episode, reward)
+        #el entrenamiento sigue mientras se escribe el checkpoint
+        algorithm.weights += 100
+    checkpointer.close()
+
+    checkpoints = [os.path.basename(checkpoint) for checkpoint in Checkpointer(str(tmp_path), resume=True).get_checkpoints()]
+    assert checkpoints == ["checkpoint_000002", "checkpoint_000003", "checkpoint_000004"]
+
+    resumed_algorithm = StubAlgorithm()
+    checkpointer = Checkpointer(str(tmp_path), keep_last=2, resume=True)
+    metadata = checkpointer.restore(resumed_algorithm)
+    checkpointer.close()
+    assert metadata["episode"] == 4
+    assert checkpointer.best_checkpoint == str(tmp_path / "checkpoint_000002")
+    #los pesos del momento en el que se guardó, no los que se siguieron entrenando
+    np.testing.assert_array_equal(resumed_algorithm.weights, np.full(1000, 304.0))
+
+
+def test_checkpoints_are_ordered_by_time_not_by_name(tmp_path):
+    checkpointer = Checkpointer(str(tmp_path), keep_last=1)
+    for episode in [999999, 1000000]:
+        checkpointer.save(StubAlgorithm(episode), episode, 0)
+    checkpointer.close()
+
+    resumed_algorithm = StubAlgorithm()
+    assert Checkpointer(str(tmp_path), resume=True).restore(resumed_algorithm)["episode"] == 1000000
+    assert resumed_algorithm.weights[0] == 1000000
+
+
+def test_fresh_run_refuses_a_folder_with_checkpoints(tmp_path):
+    checkpointer = Checkpointer(str(tmp_path))
+    checkpointer.save(StubAlgorithm(), 1, 0)
+    checkpointer.close()
+
+    with pytest.raises(ValueError):
+        Checkpointer(str(tmp_path))
+
+
+def test_rllib_algorithm_round_trip(tmp_path):
+    pytest.importorskip("ray")
+    from ray.rllib.algorithms.ppo import PPOConfig
+
+    config = PPOConfig().environment("CartPole-v1").framework("torch").rollouts(num_rollout_workers=0).training(
+        train_batch_size=64, sgd_minibatch_size=32, num_sgd_iter=1)
+    algorithm = config.build()
+    try:
+        algorithm.train()
+        checkpointer = Checkpointer(str(tmp_path))
+        checkpoint = checkpointer.save(algorithm, 1, 0)
+        weights = {name: np.copy(value) for name, value in algorithm.get_policy().get_weights().items()}
+        algorithm.train()
+        checkpointer.close()
+    finally:
+        algorithm.stop()
+
+    resumed_algorithm = config.build()
+    try:
+        Checkpointer(str(tmp_path), resume=True).restore(resumed_algorithm)
+        for name, value in resumed_algorithm.get_policy().get_weights().items():
+            np.testing.assert_array_equal(value, weights[name])
+    finally:
+        resumed_algorithm.stop()
+    assert os.path.isfile(os.path.join(checkpoint, "rllib_checkpoint.json"))
@@ -0,0 +1,25 @@
+import os
+
+import pandas as pd
+import pytest
+
+import dataset
+
+
+def test_load_bars_ignores_the_temporal_file_of_a_crashed_write(tmp_path, monkeypatch):
+    dataset_path = str(tmp_path / 'dataset')
+    bars = pd.DataFrame({'date': pd.date_range('2021-01-04', periods=10, freq='min', tz='UTC'), 'close': range(10)})
+    dataset.write_partition(bars, 'forex', 'EURUSD', '2021', dataset_path)
+
+    # The next merge of the partition crashes after writing its temporal file
+    def crash(source, destination):
+        raise OSError('crash')
+    with monkeypatch.context() as patch:
+        patch.setattr(dataset.os, 'replace', crash)
+        with pytest.raises(OSError):
+            dataset.write_partition(bars.iloc[:5], 'forex', 'EURUSD', '2021', dataset_path)
+    assert len(os.listdir(os.path.dirname(dataset.get_partition_path('forex', 'EURUSD', '2021', dataset_path)))) == 2
+
+    df = dataset.load_bars(dataset_path=dataset_path)
+
+    assert df['close'].tolist() == list(range(10))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from episode_sampler import EpisodeSampler
+
+
+def get_weekday_timestamps(freq: str, start: str = "2021-01-04", end: str = "2021-07-01") -> np.array:
+    """ Bars of a market that closes on weekends, from Friday 22:00 to Sunday 22:00 UTC """
+    dates = pd.date_range(start, end, freq=freq, tz="UTC", inclusive="left")
+    weekend = ((dates.dayofweek == 4) & (dates.hour >= 22)) | (dates.dayofweek == 5) | ((dates.dayofweek == 6) & (dates.hour < 22))
+    return dates[~weekend].as_unit("ns").asi8
+
+
+def test_weekend_closures_do_not_split_episodes():
+    timestamps = get_weekday_timestamps("1h")
+    episode_sampler = EpisodeSampler(timestamps.shape[0], 50, timestamps, episode_length=(10, 500), random_start=True, seed=0)
+
+    assert episode_sampler.longest_episode_length == 500
+    assert episode_sampler.valid_starts.shape[0] == timestamps.shape[0] - 50 - 10
+
+
+def test_daily_and_four_hour_bars_fit_the_window():
+    for freq in ("4h", "1D"):
+        timestamps = get_weekday_timestamps(freq, end="2022-01-01")
+        episode_sampler = EpisodeSampler(timestamps.shape[0], 50, timestamps, episode_length=20, random_start=True, seed=0)
+        start_step, end_step = episode_sampler.sample()
+        assert end_step - start_step == 20
+
+
+def test_missing_bars_inside_a_session_split_episodes():
+    timestamps = get_weekday_timestamps("1h")
+    #falta el miércoles 2021-03-03 entero
+    missing_day = (timestamps >= pd.Timestamp("2021-03-03", tz="UTC").value) & (timestamps < pd.Timestamp("2021-03-04", tz="UTC").value)
+    gap_row = int(np.argmax(missing_day))
+    timestamps = timestamps[~missing_day]
+    episode_sampler = EpisodeSampler(timestamps.shape[0], 50, timestamps, episode_length=(10, 500), random_start=True, seed=0)
+
+    #ningún episodio (ni su ventana) cruza el hueco
+    starts, segment_ends = episode_sampler.valid_starts, episode_sampler.valid_start_segment_ends
+    assert np.all((segment_ends < gap_row) | (starts - 50 >= gap_row))
+    assert set(np.unique(segment_ends)) == {gap_row - 1, timestamps.shape[0] - 1}
@@ -0,0 +1,241 @@
+import io
+import os
+import json
+import re
+import time
+import hashlib
+import zipfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import pandas as pd
+
+import config
+import dataset
+import downloader as downloader_module
+from downloader import Downloader
+from extract_forex import ExtractForex
+from exceptions import DownloadFailedException
+
+
+def make_year_zip(year: int, rows: int = 500) -> bytes:
+    """ Zip with the layout of the source: a monthly csv plus the csv of the whole year, without header """
+    dates = pd.date_range(f'{year}-01-02', periods=rows, freq='min')
+    lines = [f'{date:%Y.%m.%d},{date:%H:%M},{1.1 + i * 1e-5:.5f},{1.1002 + i * 1e-5:.5f},{1.0998 + i * 1e-5:.5f},{1.1001 + i * 1e-5:.5f},{i % 7 + 1}'
+             for i, date in enumerate(dates)]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        zip_file.writestr(f'EURUSD_{year}_01.csv', '\n'.join(lines[:100]) + '\n')
+        zip_file.writestr(f'EURUSD_{year}_all.csv', '\n'.join(lines) + '\n')
+    return buffer.getvalue()
+
+
+class SourceServer:
+    """
+        Local stand-in for the source of config.SOURCES. It serves files with ETag and Range support, and can be told to
+        fail a path with 503 a number of times or to drop the connection after some bytes of its next response.
+    """
+
+    def __init__(self):
+        self.files = dict()
+        self.failures = dict()
+        self.truncations = dict()
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._get_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def get_requests(self, method: str = None, path: str = None) -> list:
+        with self._lock:
+            return [request for request in self.requests if (method is None or request['method'] == method) and (path is None or request['path'] == path)]
+
+    def _get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, send_body: bool):
+                with server._lock:
+                    server.requests.append({'method': self.command, 'path': self.path, 'range': self.headers.get('Range'), 'time': time.monotonic()})
+                    failures = server.failures.get(self.path, 0)
+                    if failures > 0:
+                        server.failures[self.path] = failures - 1
+                    truncation = server.truncations.pop(self.path, None) if send_body else None
+                if failures > 0:
+                    self.send_error(503)
+                    return
+                if self.path not in server.files:
+                    self.send_error(404)
+                    return
+
+                content = server.files[self.path]
+                offset = 0
+                if self.headers.get('Range') is not None:
+                    offset = int(self.headers['Range'].split('=')[1].split('-')[0])
+                    if offset >= len(content):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(content)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {offset}-{len(content) - 1}/{len(content)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(content) - offset))
+                self.send_header('ETag', f'"{hashlib.md5(content).hexdigest()}"')
+                self.end_headers()
+                if send_body:
+                    body = content[offset:] if truncation is None else content[offset:offset + truncation]
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+            def do_GET(self):
+                self._respond(send_body=True)
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SleepRecorder:
+    """ Replaces the time module of the downloader, so backoffs are recorded instead of slept """
+
+    def __init__(self):
+        self.sleeps = []
+        self.monotonic = time.monotonic
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+
+
+@pytest.fixture
+def source_server(monkeypatch, tmp_path):
+    server = SourceServer()
+    server.start()
+    monkeypatch.setitem(config.SOURCES, 'forex', server.url + '/{}/{}.zip')
+    monkeypatch.setattr(config, 'DATA_FOLDER_PATH', str(tmp_path))
+    yield server
+    server.stop()
+
+
+def test_extract_forex_retries_resumes_and_skips_unchanged_years(source_server, monkeypatch, caplog):
+    monkeypatch.setattr(downloader_module, 'time', SleepRecorder())
+    source_server.files = {f'/{year}/EURUSD.zip': make_year_zip(year) for year in (2019, 2020)}
+    source_server.failures = {'/2019/EURUSD.zip': 2}
+    source_server.truncations = {'/2020/EURUSD.zip': 1000}
+
+    ExtractForex(assets=['EURUSD'], start_year=2018, end_year=2020, workers=2).run()
+
+    # 2018 doesn't exist in the source (404, not retried), 2019 succeeds on the third attempt after two backoffs
+    assert len(source_server.get_requests('GET', '/2018/EURUSD.zip')) == 1
+    assert len(source_server.get_requests('GET', '/2019/EURUSD.zip')) == 3
+    # 2020 dropped the connection after 1000 bytes and was resumed from there
+    assert [request['range'] for request in source_server.get_requests('GET', '/2020/EURUSD.zip')] == [None, 'bytes=1000-']
+    # Backoffs of the two failures of 2019 and of the dropped connection of 2020
+    backoffs = sorted(float(backoff) for backoff in re.findall(r'Retrying in ([0-9.]+)s', caplog.text))
+    assert backoffs == [config.DOWNLOAD_BACKOFF_FACTOR, config.DOWNLOAD_BACKOFF_FACTOR, config.DOWNLOAD_BACKOFF_FACTOR * 2]
+
+    for year in (2019, 2020):
+        partition = pd.read_parquet(dataset.get_partition_path('forex', 'EURUSD', str(year)))
+        assert len(partition) == 500
+        assert partition['date'].iloc[0] == pd.Timestamp(f'{year}-01-02', tz='UTC')
+        assert not os.path.exists(ExtractForex.get_year_file_path('forex', 'EURUSD', str(year)) + '.part')
+
+    # Closed years already in the manifest aren't requested again
+    requests_before = len(source_server.get_requests())
+    ExtractForex(assets=['EURUSD'], start_year=2019, end_year=2020, workers=2).run()
+    assert len(source_server.get_requests()) == requests_before
+
+
+def test_extract_forex_updates_a_past_year_extracted_while_it_was_open(source_server, monkeypatch):
+    monkeypatch.setattr(downloader_module, 'time', SleepRecorder())
+    source_server.files = {f'/{year}/EURUSD.zip': make_year_zip(year) for year in (2019, 2020)}
+    ExtractForex(assets=['EURUSD'], start_year=2019, end_year=2020, workers=2).run()
+
+    # 2020 was extracted in the middle of 2020 and the source got the rest of the year afterwards
+    manifest_path = os.path.join(config.DATA_FOLDER_PATH, 'forex', 'manifest.json')
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest['EURUSD/2020']['extracted_at'] = '2020-06-30T12:00:00'
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    source_server.files['/2020/EURUSD.zip'] = make_year_zip(2020, rows=800)
+    requests_before = len(source_server.get_requests())
+
+    ExtractForex(assets=['EURUSD'], start_year=2019, end_year=2020, workers=2).run()
+
+    requests = source_server.get_requests()[requests_before:]
+    assert [request['path'] for request in requests if request['path'].startswith('/2019/')] == []
+    assert len([request for request in requests if request['method'] == 'GET' and request['path'] == '/2020/EURUSD.zip']) == 1
+    assert len(pd.read_parquet(dataset.get_partition_path('forex', 'EURUSD', '2020'))) == 800
+
+
+def test_downloader_gives_up_after_max_retries(source_server, tmp_path, monkeypatch):
+    sleep_recorder = SleepRecorder()
+    monkeypatch.setattr(downloader_module, 'time', sleep_recorder)
+    source_server.files = {'/file.zip': b'content'}
+    source_server.failures = {'/file.zip': 10}
+
+    downloader = Downloader(workers=1, max_retries=3, backoff_factor=0.5, requests_per_second=0)
+    with pytest.raises(DownloadFailedException):
+        downloader.download(source_server.url + '/file.zip', str(tmp_path / 'file.zip'))
+    downloader.close()
+
+    assert len(source_server.get_requests('GET', '/file.zip')) == 4
+    assert sleep_recorder.sleeps == [0.5, 1.0, 2.0]
+
+
+def test_downloader_rate_limits_requests_to_the_same_host(source_server, tmp_path):
+    source_server.files = {f'/{index}.zip': b'content' for index in range(6)}
+    requests_per_second = 20
+
+    downloader = Downloader(workers=3, requests_per_second=requests_per_second)
+    threads = [threading.Thread(target=downloader.download, args=(source_server.url + f'/{index}.zip', str(tmp_path / f'{index}.zip')))
+               for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    downloader.close()
+
+    request_times = sorted(request['time'] for request in source_server.get_requests('GET'))
+    assert len(request_times) == 6
+    # The server records the time it handles each request, so a single interval can shrink with the scheduling of its
+    # threads, but the whole span can't
+    assert request_times[-1] - request_times[0] >= 0.8 * (len(request_times) - 1) / requests_per_second
+
+
+@pytest.mark.parametrize('part_content, part_info', [
+    (b'x' * 20, None),  # Bigger than the remote file and without .part.json
+    (b'content', '{"etag": null, "size": 100}')  # The size of the .part.json is out of date
+])
+def test_downloader_restarts_a_part_file_that_does_not_match_the_remote_file(source_server, tmp_path, part_content, part_info):
+    source_server.files = {'/file.zip': b'content'}
+    file_path = tmp_path / 'file.zip'
+    (tmp_path / 'file.zip.part').write_bytes(part_content)
+    if part_info is not None:
+        (tmp_path / 'file.zip.part.json').write_text(part_info)
+
+    downloader = Downloader(workers=1, max_retries=0, requests_per_second=0)
+    downloader.download(source_server.url + '/file.zip', str(file_path))
+    downloader.close()
+
+    assert file_path.read_bytes() == b'content'
+    assert [request['range'] for request in source_server.get_requests('GET', '/file.zip')] == [f'bytes={len(part_content)}-', None]
+    assert not os.path.exists(f'{file_path}.part') and not os.path.exists(f'{file_path}.part.json')
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from feature_engine import FeatureEngine
+
+
+def get_closes(nan_rows=()) -> pd.Series:
+    closes = pd.Series(1.1 + np.cumsum(np.random.default_rng(0).normal(0, 1e-3, 2000)))
+    closes.iloc[list(nan_rows)] = np.nan
+    return closes
+
+
+def test_denoised_is_identical_to_pandas_ewm():
+    for nan_rows in ((), (0, 1, 500, 1200, 1201, 1202)):
+        closes = get_closes(nan_rows)
+        features = FeatureEngine(alpha=0.01).transform_df(closes)
+        expected = closes.ewm(alpha=0.01).mean()
+        assert np.array_equal(features["DENOISED"].to_numpy(), expected.to_numpy(), equal_nan=True)
+
+
+def test_streaming_from_a_checkpoint_is_identical_to_batch(tmp_path):
+    closes = get_closes((700,)).to_numpy()
+    batch_features = FeatureEngine().transform(closes)
+
+    feature_engine = FeatureEngine()
+    feature_engine.transform(closes[:1000])
+    feature_engine.save_checkpoint(str(tmp_path / "checkpoint.json"))
+    restored_feature_engine = FeatureEngine.load_checkpoint(str(tmp_path / "checkpoint.json"))
+    streamed_features = np.array([restored_feature_engine.update(close) for close in closes[1000:]])
+
+    assert np.array_equal(streamed_features, batch_features[1000:], equal_nan=True)
@@ -0,0 +1,38 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_store import FeatureStore, INDEX_FILENAME
+
+
+def compute_features() -> pd.DataFrame:
+    return pd.DataFrame({"close": np.arange(10000, dtype=np.float64), "DENOISED": np.arange(10000, dtype=np.float64) / 2})
+
+
+def test_entries_written_by_another_store_are_hits(tmp_path):
+    writer_store, reader_store = FeatureStore(str(tmp_path)), FeatureStore(str(tmp_path))
+    writer_store.get("v1", "EURUSD", "1m", {"columns": ["DENOISED"]}, compute_features)
+
+    index_modification_time = os.stat(tmp_path / INDEX_FILENAME).st_mtime_ns
+    table = reader_store.get("v1", "EURUSD", "1m", {"columns": ["DENOISED"]}, lambda: None)
+
+    assert table.to_pandas().equals(compute_features())
+    assert (reader_store.hits, reader_store.misses) == (1, 0)
+    assert os.stat(tmp_path / INDEX_FILENAME).st_mtime_ns == index_modification_time
+
+
+def test_size_limit_holds_across_stores(tmp_path):
+    entry_size_mb = 10000 * 2 * 8 / 1024 / 1024
+    stores = [FeatureStore(str(tmp_path), max_size_mb=2.5 * entry_size_mb) for _ in range(2)]
+    for version in range(4):
+        stores[version % 2].get(f"v{version}", "EURUSD", "1m", {}, compute_features)
+        time.sleep(0.01)
+    #v2 se usa después de v3, así que al añadir v4 la menos usada recientemente es v3
+    stores[0].get("v2", "EURUSD", "1m", {}, compute_features)
+    stores[1].get("v4", "EURUSD", "1m", {}, compute_features)
+
+    keys = {FeatureStore.get_key(f"v{version}", "EURUSD", "1m", {}) for version in (2, 4)}
+    assert {filename[:-len(".arrow")] for filename in os.listdir(tmp_path) if filename.endswith(".arrow")} == keys
+    assert stores[0].get_stats()["entries"] == 2
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from single_asset_trading_environment import SingleAssetTradingEnvironment
+from multi_asset_trading_environment import MultiAssetTradingEnvironment
+
+EPISODE_LENGTH = 25
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    close = 1.1 + np.cumsum(np.random.default_rng(0).normal(0, 1e-3, 200))
+    path = tmp_path / "data.csv"
+    pd.DataFrame({
+        "date": pd.date_range("2021-01-04", periods=close.shape[0], freq="min", tz="UTC"),
+        "asset": "A", "open": close, "high": close + 0.002, "close": close, "min": close - 0.002
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def get_config(data_path: str, **config) -> dict:
+    return {"data_path": data_path, "initial_account_balance": 10000, "window_size": 10, "episode_length": EPISODE_LENGTH,
+            "instrumentation": True, **config}
+
+
+@pytest.mark.parametrize("env_class, config, action", [
+    (SingleAssetTradingEnvironment, {}, 2),
+    (MultiAssetTradingEnvironment, {"assets": ["A"]}, [2])
+])
+def test_terminal_step_is_counted_in_its_episode(data_path, env_class, config, action):
+    env = env_class(get_config(data_path, **config))
+    reported_metrics = []
+    env.reset()
+    while len(reported_metrics) < 2:
+        observation, reward, terminated, truncated, info = env.step(action)
+        if terminated:
+            reported_metrics.append(info["STEP METRICS"])
+            env.reset()
+
+    for step_metrics in reported_metrics:
+        assert step_metrics["step_calls"] == EPISODE_LENGTH
+        assert step_metrics["take_action_calls"] == EPISODE_LENGTH
+
+
+def test_terminal_vector_step_is_counted_in_its_episode(data_path):
+    pytest.importorskip("ray")
+    from vectorized_single_asset_trading_environment import VectorizedSingleAssetTradingEnvironment
+
+    env = VectorizedSingleAssetTradingEnvironment(get_config(data_path, num_envs=4))
+    env.vector_reset()
+    for _ in range(2):
+        for _ in range(EPISODE_LENGTH):
+            observations, rewards, terminateds, truncateds, infos = env.vector_step([2] * 4)
+        assert all(terminateds)
+        assert infos[0]["STEP METRICS"]["step_calls"] == EPISODE_LENGTH
+        for index in range(4):
+            env.reset_at(index)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from single_asset_trading_environment import SingleAssetTradingEnvironment
+
+NUM_ENVS = 4
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    random_generator = np.random.default_rng(0)
+    close = 1.1 + np.cumsum(random_generator.normal(0, 1e-3, 300))
+    path = tmp_path / "data.csv"
+    pd.DataFrame({
+        "date": pd.date_range("2021-01-04", periods=close.shape[0], freq="h", tz="UTC"),
+        "open": close + random_generator.normal(0, 1e-4, close.shape[0]), "high": close + 0.002, "close": close, "min": close - 0.002
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("episode_length", [None, 30])
+def test_vector_env_matches_single_envs(data_path, episode_length):
+    pytest.importorskip("ray")
+    from vectorized_single_asset_trading_environment import VectorizedSingleAssetTradingEnvironment
+
+    config = {"data_path": data_path, "initial_account_balance": 10000, "window_size": 20, "episode_length": episode_length}
+    single_envs = [SingleAssetTradingEnvironment(config) for _ in range(NUM_ENVS)]
+    vector_env = VectorizedSingleAssetTradingEnvironment(dict(config, num_envs=NUM_ENVS))
+
+    vector_observations, _ = vector_env.vector_reset()
+    for index, single_env in enumerate(single_envs):
+        np.testing.assert_array_equal(vector_observations[index], single_env.reset()[0])
+
+    #varios episodios por sub environment, así que también se comprueban los resets
+    actions = np.random.default_rng(1).integers(3, size=(600, NUM_ENVS))
+    for step_actions in actions:
+        vector_observations, vector_rewards, vector_terminateds, vector_truncateds, _ = vector_env.vector_step(list(step_actions))
+        for index, single_env in enumerate(single_envs):
+            observation, reward, terminated, truncated, _ = single_env.step(int(step_actions[index]))
+            assert vector_rewards[index] == reward
+            assert vector_terminateds[index] == terminated
+            assert vector_truncateds[index] == truncated
+            np.testing.assert_array_equal(vector_observations[index], observation)
+            if terminated:
+                np.testing.assert_array_equal(vector_env.reset_at(index)[0], single_env.reset()[0])